@@ -0,0 +1,123 @@
+import asyncio
+import time
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+class AsyncTTLCache(Generic[T]):
+    """
+    process wide cache of coroutine results, each kept for ttl seconds.
+    single-flight: concurrent misses of the same key share one call of fetch instead of each making their own.
+    failures are not cached, every waiter of the failed call gets the exception.
+    expired values are kept up to stale_ttl seconds, get_within() falls back to them when a fetch is late or fails
+    """
+
+    def __init__(
+        self, ttl: float, max_entries: int = 4096, stale_ttl: Optional[float] = None
+    ):
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl or 0)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._entries: Dict[Hashable, Tuple[float, T]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        return (
+            f"{len(self)} entries, {self.hits} hits, {self.misses} misses"
+            f" ({100 * self.hits // max(total, 1)}% hit rate), {self.stale_hits} stale"
+        )
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """seconds since the cached value of key was fetched, None if not cached"""
+        entry = self._entries.get(key)
+        return time.monotonic() - entry[0] if entry else None
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+        # shield: a cancelled waiter must not cancel the fetch the others wait for
+        return await asyncio.shield(self._fetch(key, fetch))
+
+    async def get_within(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[T]],
+        deadline: Optional[float] = None,
+        refresh: bool = False,
+    ) -> Tuple[T, float]:
+        """
+        stale-while-revalidate get: when the fetch is not done within deadline seconds, or fails,
+        the last good value is returned instead while the fetch carries on and refreshes the cache.
+        without a stale value it waits for the fetch, or raises its exception
+        :param refresh: fetch even if the cached value is fresh, it is still the fallback
+        :return: value and its age in seconds
+        """
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if not refresh and entry and now - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1], now - entry[0]
+        inflight = self._fetch(key, fetch)
+        try:
+            return await asyncio.wait_for(asyncio.shield(inflight), deadline), 0.0
+        except Exception as e:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry and now - entry[0] < self.stale_ttl:
+                self.stale_hits += 1
+                return entry[1], now - entry[0]
+            if isinstance(e, asyncio.TimeoutError):
+                return await asyncio.shield(inflight), 0.0
+            raise
+
+    def _fetch(
+        self, key: Hashable, fetch: Callable[[], Awaitable[T]]
+    ) -> asyncio.Future:
+        """the call of fetch in flight for key, started if there is none"""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return inflight
+        self.misses += 1
+        inflight = asyncio.ensure_future(fetch())
+        self._inflight[key] = inflight
+        # settled by callback, so the value is cached even if every waiter was cancelled meanwhile
+        inflight.add_done_callback(lambda future: self._settle(key, future))
+        return inflight
+
+    def _settle(self, key: Hashable, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self.put(key, future.result())
+
+    def put(self, key: Hashable, value: T):
+        self._entries.pop(key, None)  # re-insert, dict order is fetch order
+        self._entries[key] = (time.monotonic(), value)
+        if len(self._entries) > self.max_entries:
+            now = time.monotonic()
+            self._entries = {
+                k: entry
+                for k, entry in self._entries.items()
+                if now - entry[0] < self.stale_ttl
+            }
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
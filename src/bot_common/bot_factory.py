@@ -1,5 +1,5 @@
 import logging
-from typing import List, Optional, Tuple
+from typing import Awaitable, Callable, List, Optional, Tuple
 
 from bot_common.bot_config.bot_config import BotConfig
 from bot_common.common_handler import (
@@ -63,6 +63,7 @@ class BotBuilder:
         self.daily_jobs = []
         self.error_handler = None
         self.onetime_jobs = []
+        self.post_shutdown_hooks = []
 
     def add_handlers(self, handlers: List[BaseHandler]):
         self.handlers.extend(handlers)
@@ -83,12 +84,19 @@ class BotBuilder:
         self.daily_jobs.extend(daily_jobs)
         return self
 
+    def add_post_shutdown(
+        self, post_shutdown_hooks: List[Callable[[Application], Awaitable]]
+    ):
+        """run in order after the application shut down, e.g. to close shared clients"""
+        self.post_shutdown_hooks.extend(post_shutdown_hooks)
+        return self
+
     def build(self):
         # do not await handler
         # https://stackoverflow.com/questions/77034884/how-to-make-my-telegram-bots-handler-not-block-each-other
         df = Defaults(block=False)
         logging.getLogger("httpx").setLevel("WARNING")
-        application = (
+        application_builder = (
             ApplicationBuilder()
             .token(self.bot_token)
             .http_version("1.1")
@@ -99,8 +107,10 @@ class BotBuilder:
             .get_updates_http_version("1.1")
             .concurrent_updates(3)
             .defaults(df)  #
-            .build()
         )
+        if self.post_shutdown_hooks:
+            application_builder.post_shutdown(self._post_shutdown)
+        application = application_builder.build()
         application.bot_data["bot_config"] = self.bot_config
         application.add_error_handler(error_handler_network)
         application.add_handlers(self.handlers)
@@ -124,3 +134,7 @@ class BotBuilder:
                 daily_job[0], **(daily_job[1] | self.common_job_kwargs)
             )
         return application
+
+    async def _post_shutdown(self, application: Application):
+        for post_shutdown_hook in self.post_shutdown_hooks:
+            await post_shutdown_hook(application)
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Set
+
+if TYPE_CHECKING:  # only for annotations, the pool works with anything browser-like
+    from nodriver.core.browser import Browser
+    from nodriver.core.tab import Tab
+
+
+class PooledTab:
+    """
+    browser-like view of one pooled tab, for code written against Browser.get():
+    get() navigates this tab instead of opening a page in the browser's main tab
+    """
+
+    def __init__(self, browser: "Browser", tab: "Tab"):
+        self.browser = browser
+        self.tab = tab
+        self.uses = 0
+
+    @property
+    def main_tab(self) -> "Tab":
+        return self.tab
+
+    async def get(
+        self, url: str = "about:blank", new_tab: bool = False, new_window: bool = False
+    ) -> "Tab":
+        return await self.tab.get(url)
+
+    def __getattr__(self, name):
+        return getattr(self.browser, name)
+
+
+class TabPool:
+    """
+    bounded pool of warm tabs of one browser, opened on warm_url up front so a checkout skips
+    the page bootstrap (connection, cookies, scripts) and concurrent users get their own tab instead of queueing.
+    a tab is retired after max_uses checkouts, or after a checkout failing with it, and replaced in the background
+    """
+
+    def __init__(
+        self,
+        browser: "Browser",
+        size: int = 3,
+        warm_url: str = "about:blank",
+        max_uses: int = 50,
+    ):
+        self.browser = browser
+        self.size = size
+        self.warm_url = warm_url
+        self.max_uses = max_uses
+        self._idle: List[PooledTab] = []
+        self._open = 0  # idle, checked out or being opened
+        # background replacements of retired tabs
+        self._replacing: Set[asyncio.Task] = set()
+        self._condition = asyncio.Condition()
+
+    def __str__(self) -> str:
+        return f"{self._open}/{self.size} tabs open, {len(self._idle)} idle"
+
+    async def warm(self):
+        """open the tabs up to size"""
+        await asyncio.gather(
+            *[self._replace(None) for _ in range(self.size - self._open)]
+        )
+
+    @asynccontextmanager
+    async def checkout(self) -> AsyncIterator[PooledTab]:
+        tab = await self._acquire()
+        healthy = False
+        try:
+            yield tab
+            healthy = True
+        finally:
+            tab.uses += 1
+            # a tab of the browser before a restart is retired too
+            await self._release(
+                tab,
+                healthy and tab.uses < self.max_uses and tab.browser is self.browser,
+            )
+
+    async def reset(self, browser: "Browser"):
+        """move to a restarted browser: idle tabs are dropped, checked out ones are retired when returned"""
+        async with self._condition:
+            self.browser = browser
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        await self.warm()
+
+    async def close(self):
+        """close the idle tabs, after the background replacements, so their tabs are closed too"""
+        await asyncio.gather(*self._replacing, return_exceptions=True)
+        async with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        await asyncio.gather(*[_close(tab) for tab in idle])
+
+    async def _acquire(self) -> PooledTab:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._idle or self._open < self.size)
+            if self._idle:
+                return self._idle.pop()  # most recently used, the warmest
+            self._open += 1
+        try:
+            return await self._new_tab()
+        except BaseException:
+            await self._discard()
+            raise
+
+    async def _release(self, tab: PooledTab, keep: bool):
+        if keep:
+            async with self._condition:
+                self._idle.append(tab)
+                self._condition.notify()
+        else:
+            # referenced until done, the loop keeps only weak references to tasks
+            task = asyncio.create_task(self._replace(tab))
+            self._replacing.add(task)
+            task.add_done_callback(self._replacing.discard)
+
+    async def _replace(self, retired: Optional[PooledTab]):
+        """close retired, if any, and open a warm tab in its place"""
+        if retired is None:
+            async with self._condition:
+                self._open += 1
+        else:
+            await _close(retired)
+        try:
+            tab = await self._new_tab()
+        except Exception as e:
+            logging.getLogger(__name__).error(f"failed to open a pooled tab: {e}")
+            await self._discard()
+            return
+        async with self._condition:
+            self._idle.append(tab)
+            self._condition.notify()
+
+    async def _discard(self):
+        """give up a slot, a waiter may open a tab in it"""
+        async with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    async def _new_tab(self) -> PooledTab:
+        return PooledTab(
+            self.browser, await self.browser.get(self.warm_url, new_tab=True)
+        )
+
+
+async def _close(tab: PooledTab):
+    try:
+        await tab.tab.close()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"failed to close a pooled tab: {e}")
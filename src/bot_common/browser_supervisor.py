@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from bot_common.browser_pool import TabPool
+
+if TYPE_CHECKING:
+    from nodriver.core.browser import Browser
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class BrowserSupervisor:
+    """
+    owns the nodriver browser of a bot. check() restarts it when it stops answering a liveness probe
+    max_probe_failures times in a row, or its process tree grows over max_rss_mb or it leaks over max_tabs tabs.
+    a restart re-warms the tab pool attached to it, if any
+    """
+
+    def __init__(
+        self,
+        max_rss_mb: float = 2048,
+        max_tabs: int = 30,
+        probe_timeout: float = 15,
+        max_probe_failures: int = 2,
+    ):
+        self.max_rss_mb = max_rss_mb
+        self.max_tabs = max_tabs
+        self.probe_timeout = probe_timeout
+        self.max_probe_failures = max_probe_failures
+        self.browser: Optional["Browser"] = None
+        self.tab_pool: Optional[TabPool] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.last_restart_reason: Optional[str] = None
+        self._probe_failures = 0
+
+    def __str__(self) -> str:
+        if self.browser is None:
+            return "browser not started"
+        status = (
+            f"browser up {(time.monotonic() - self.started_at) / 3600:.1f}h, {self.rss_mb():.0f} MB, "
+            f"{self.tab_count()} tabs, {self.restarts} restarts"
+        )
+        if self.last_restart_reason:
+            status += f" (last: {self.last_restart_reason})"
+        if self.tab_pool:
+            status += f", pool {self.tab_pool}"
+        return status
+
+    async def start(self) -> "Browser":
+        import nodriver as uc  # only bots with a browser need nodriver
+
+        self.browser = await uc.start()
+        self.started_at = time.monotonic()
+        self._probe_failures = 0
+        return self.browser
+
+    def rss_mb(self) -> float:
+        """resident memory of chrome and all its child processes"""
+        pid = getattr(self.browser, "_process_pid", None)
+        return _process_tree_rss(pid) / 2**20 if pid else 0.0
+
+    def tab_count(self) -> int:
+        return len(self.browser.tabs) if self.browser else 0
+
+    async def probe(self) -> bool:
+        try:
+            await asyncio.wait_for(
+                self.browser.main_tab.evaluate("1 + 1"), self.probe_timeout
+            )
+            return True
+        except Exception as e:
+            logging.getLogger(__name__).warning(
+                f"browser liveness probe failed: {type(e).__name__} {e}"
+            )
+            return False
+
+    async def check(self) -> Optional[str]:
+        """
+        restart the browser when unhealthy
+        :return: why it was restarted, None if it is healthy
+        """
+        if await self.probe():
+            self._probe_failures = 0
+        else:
+            self._probe_failures += 1
+        reason = None
+        if self._probe_failures >= self.max_probe_failures:
+            reason = f"{self._probe_failures} liveness probes failed"
+        elif (rss_mb := self.rss_mb()) > self.max_rss_mb:
+            reason = f"{rss_mb:.0f} MB resident"
+        elif (tab_count := self.tab_count()) > self.max_tabs:
+            reason = f"{tab_count} tabs open"
+        if reason:
+            await self.restart(reason)
+        return reason
+
+    async def restart(self, reason: str) -> "Browser":
+        logging.getLogger(__name__).warning(f"restarting browser: {reason}")
+        try:
+            self.browser.stop()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"failed to stop browser: {e}")
+        await self.start()
+        self.restarts += 1
+        self.last_restart_reason = reason
+        if self.tab_pool:
+            await self.tab_pool.reset(self.browser)
+        return self.browser
+
+
+def _process_tree_rss(pid: int) -> int:
+    """bytes resident of pid and its descendants, from /proc"""
+    children: Dict[int, List[int]] = {}
+    rss: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # comm, the second field, may hold spaces, the rest follows its closing parenthesis
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue  # exited meanwhile
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * PAGE_SIZE
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        total += rss.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total
@@ -0,0 +1,54 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple, Union
+
+
+class ChatStore:
+    """
+    small per chat (or per user) state, e.g. a saved dashboard or a subscription, kept across restarts.
+    one sqlite table per store, values are JSON. mirrored in memory, reads never touch the database
+    """
+
+    def __init__(self, db_path: Union[str, Path] = ":memory:", table: str = "chats"):
+        if not table.isidentifier():
+            raise ValueError(f"invalid table name {table}")
+        self.table = table
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (chat_id INTEGER PRIMARY KEY, value TEXT)"
+        )
+        self._entries: Dict[int, Any] = {
+            chat_id: json.loads(value)
+            for chat_id, value in self._conn.execute(
+                f"SELECT chat_id, value FROM {table}"
+            )
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._entries
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        return iter(list(self._entries.items()))
+
+    def get(self, chat_id: int, default: Any = None) -> Any:
+        return self._entries.get(chat_id, default)
+
+    def put(self, chat_id: int, value: Any):
+        self._entries[chat_id] = value
+        with self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?)",
+                (chat_id, json.dumps(value)),
+            )
+
+    def discard(self, chat_id: int):
+        if self._entries.pop(chat_id, None) is not None:
+            with self._conn:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE chat_id = ?", (chat_id,)
+                )
@@ -1,13 +1,17 @@
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 import logging
-import nodriver as uc
 import pandas as pd
-from nodriver.core.browser import Browser
 import telegram
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from bot_common.bot_config.bot_config import BotConfig
+from bot_common.browser_supervisor import BrowserSupervisor
+from bot_common.file_id_cache import FileIdCache
+
+if TYPE_CHECKING:
+    from nodriver.core.browser import Browser
 
 
 # handlers will be applied in the order defined...if accepted by one handler, it will stop processing more rules
@@ -19,9 +23,12 @@ async def heart_beat_job(context: ContextTypes.DEFAULT_TYPE):
     active = pd.Timestamp.utcnow().strftime("%Y-%m-%d %H:%M")
     # bot_config.redis_conn.hmset(bot_config.bot_name, {"last_active": active})
 
+    text = f"heart beat from {bot_config.bot_name} at {active} UTC"
+    if "browser_supervisor" in context.bot_data:
+        text += f"\n{context.bot_data['browser_supervisor']}"
     await context.bot.send_message(
         chat_id=bot_config.heart_beat_chat,
-        text=f"heart beat from {bot_config.bot_name} at {active} UTC",
+        text=text,
     )
 
 
@@ -48,14 +55,37 @@ async def error_handler_network(
         logger.warning("httpx network error occurred")
 
 
-async def send_file(file: Path, update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def send_file(
+    file: Path,
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    file_id_cache: Optional[FileIdCache] = None,
+):
+    """
+    send file as a document. with file_id_cache, a file sent before is referenced by its telegram file_id
+    instead of being uploaded again
+    """
     if (not file) or (not file.is_file()):
         await update.message.reply_text("file invalid")
         return
-    elif file.stat().st_size <= 49 * 0x100000:  # up to 49MB
+    stat = file.stat()
+    # not truthiness: an empty cache has len 0
+    file_id = file_id_cache.get(file, stat) if file_id_cache is not None else None
+    if file_id:
+        try:
+            await context.bot.send_document(update.message.chat_id, file_id)
+            return
+        except telegram.error.BadRequest as e:
+            logging.getLogger(__name__).warning(
+                f"cached file_id of {file} rejected: {e}"
+            )
+            file_id_cache.discard(file)
+    if stat.st_size <= 49 * 0x100000:  # up to 49MB
         status_message = await update.message.reply_text("uploading")
         with open(file, "rb") as doc:
-            await context.bot.send_document(update.message.chat_id, doc)
+            message = await context.bot.send_document(update.message.chat_id, doc)
+        if file_id_cache is not None and message.document:
+            file_id_cache.put(file, stat, message.document.file_id)
         await status_message.delete()
         return
     else:
@@ -66,6 +96,23 @@ async def send_file(file: Path, update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def init_browser_handler(context: ContextTypes.DEFAULT_TYPE):
-    browser: Browser = await uc.start()
+    supervisor = BrowserSupervisor()
+    browser: "Browser" = await supervisor.start()
     context.bot_data["browser"] = browser
+    context.bot_data["browser_supervisor"] = supervisor
     return
+
+
+async def browser_supervisor_job(context: ContextTypes.DEFAULT_TYPE):
+    """restart the browser when unhealthy, handlers pick up the new one from bot_data"""
+    bot_config: BotConfig = context.bot_data["bot_config"]
+    supervisor: BrowserSupervisor = context.bot_data.get("browser_supervisor")
+    if supervisor is None:
+        return  # init_browser_handler not run yet
+    reason = await supervisor.check()
+    if reason:
+        context.bot_data["browser"] = supervisor.browser
+        await context.bot.send_message(
+            chat_id=bot_config.error_notify_chat,
+            text=f"{bot_config.bot_name} restarted its browser: {reason}",
+        )
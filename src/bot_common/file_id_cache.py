@@ -0,0 +1,59 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+
+class FileIdCache:
+    """
+    telegram file_id of documents already uploaded, so a file is only uploaded once.
+    keyed by local path, an entry is only valid while the file keeps the size and mtime it had when uploaded.
+    persisted in sqlite and mirrored in memory, lookups never touch the database
+    """
+
+    def __init__(self, db_path: Union[str, Path] = ":memory:"):
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids "
+            "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, file_id TEXT)"
+        )
+        self._entries: Dict[str, Tuple[int, int, str]] = {
+            path: (size, mtime_ns, file_id)
+            for path, size, mtime_ns, file_id in self._conn.execute(
+                "SELECT path, size, mtime_ns, file_id FROM file_ids"
+            )
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, file: Path, stat: os.stat_result) -> Optional[str]:
+        """file_id of file, None if never uploaded or changed since. a changed file drops its entry"""
+        entry = self._entries.get(str(file))
+        if entry is None:
+            return None
+        size, mtime_ns, file_id = entry
+        if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            self.discard(file)
+            return None
+        return file_id
+
+    def peek(self, file: Union[str, Path]) -> Optional[str]:
+        """file_id of file without checking it is unchanged, for when even a stat is too slow"""
+        entry = self._entries.get(str(file))
+        return entry[2] if entry else None
+
+    def put(self, file: Path, stat: os.stat_result, file_id: str):
+        self._entries[str(file)] = (stat.st_size, stat.st_mtime_ns, file_id)
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_ids VALUES (?, ?, ?, ?)",
+                (str(file), stat.st_size, stat.st_mtime_ns, file_id),
+            )
+
+    def discard(self, file: Path):
+        if self._entries.pop(str(file), None) is not None:
+            with self._conn:
+                self._conn.execute("DELETE FROM file_ids WHERE path = ?", (str(file),))
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import httpx
+import telegram
+from telegram import Message
+from telegram.ext import Application, ContextTypes
+
+CHUNK_SIZE = 256 * 1024
+
+
+class UploadProgress:
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.sent = 0
+
+    def __str__(self):
+        return (
+            f"{100 * self.sent // max(self.total, 1)}% "
+            f"({self.sent / 0x100000:.1f}/{self.total / 0x100000:.1f} MB)"
+        )
+
+
+def get_http_client(context: ContextTypes.DEFAULT_TYPE) -> httpx.AsyncClient:
+    """one pooled client per bot, shared by all handlers"""
+    if "http_client" not in context.bot_data:
+        context.bot_data["http_client"] = httpx.AsyncClient(
+            timeout=httpx.Timeout(30, read=300, write=300),
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+        )
+    return context.bot_data["http_client"]
+
+
+async def close_http_client(application: Application):
+    """post_shutdown hook closing the client of get_http_client, if it was ever opened"""
+    http_client = application.bot_data.pop("http_client", None)
+    if http_client is not None:
+        await http_client.aclose()
+
+
+async def _read_chunks(
+    file: Path, progress: Optional[UploadProgress]
+) -> AsyncIterator[bytes]:
+    f = await asyncio.to_thread(open, file, "rb")
+    try:
+        while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+            if progress:
+                progress.sent += len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def post_file(
+    client: httpx.AsyncClient,
+    url: str,
+    file: Path,
+    filename: str,
+    field: str = "file",
+    progress: Optional[UploadProgress] = None,
+) -> httpx.Response:
+    """
+    multipart/form-data upload of a single file.
+    the body is streamed, reading the file chunk by chunk in a worker thread so the event loop never waits on disk
+    """
+    boundary = uuid.uuid4().hex
+    quoted_filename = filename.replace("\\", "\\\\").replace('"', "%22")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{quoted_filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    size = (await asyncio.to_thread(os.stat, file)).st_size
+    if progress:
+        progress.total = size
+
+    async def body() -> AsyncIterator[bytes]:
+        yield head
+        async for chunk in _read_chunks(file, progress):
+            yield chunk
+        yield tail
+
+    return await client.post(
+        url,
+        content=body(),
+        headers={
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + size + len(tail)),
+        },
+    )
+
+
+async def report_upload_progress(
+    status_message: Message, title: str, progress: UploadProgress, interval: float = 3
+):
+    """edit status_message with the progress every interval seconds, until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await status_message.edit_text(f"{title}: {progress}")
+        except telegram.error.BadRequest:
+            pass  # message not modified
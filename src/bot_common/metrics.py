@@ -0,0 +1,132 @@
+import bisect
+import math
+from typing import Dict, List, Optional, Sequence
+
+# latency bucket upper bounds in milliseconds
+DEFAULT_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    """fixed bucket histogram, cheap enough to observe on every call"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> List[int]:
+        return list(self.counts)
+
+    def quantile(self, q: float, since: Optional[List[int]] = None) -> float:
+        """
+        upper bound of the bucket holding the q quantile, max for the +inf bucket, nan when empty
+        :param since: a snapshot(), to get the quantile of what was observed after it
+        """
+        counts = [n - m for n, m in zip(self.counts, since)] if since else self.counts
+        total = sum(counts)
+        if not total:
+            return math.nan
+        rank = q * total
+        seen = 0
+        for bound, n in zip(self.buckets + (self.max,), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class SourceMetrics:
+    """calls to one upstream source: latency, payload size and failures"""
+
+    def __init__(self):
+        self.latency_ms = Histogram()
+        self.payload_total = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def calls(self) -> int:
+        return self.latency_ms.count + self.failures
+
+    def observe(self, latency_ms: float, payload: int):
+        self.latency_ms.observe(latency_ms)
+        self.payload_total += payload
+
+    def fail(self, error: BaseException):
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+
+    def summary(self) -> str:
+        latency = self.latency_ms
+        return (
+            f"{self.calls} calls, {self.failures} failed, "
+            f"p50 {latency.quantile(0.5):.0f}ms p99 {latency.quantile(0.99):.0f}ms max {latency.max:.0f}ms, "
+            f"avg payload {self.payload_total / max(latency.count, 1):.1f}"
+        )
+
+
+class MetricsAlert:
+    """
+    compares each source with the previous check(): alerts on a heavy tail (p99 over p99_ms)
+    or a failure rate over max_failure_rate during that window
+    """
+
+    def __init__(self, p99_ms: float = 5000, max_failure_rate: float = 0.2):
+        self.p99_ms = p99_ms
+        self.max_failure_rate = max_failure_rate
+        self._previous: Dict[str, tuple] = {}
+
+    def check(self, sources: Dict[str, SourceMetrics]) -> List[str]:
+        alerts = []
+        for name, metrics in sources.items():
+            counts, failures, calls = self._previous.get(name, (None, 0, 0))
+            self._previous[name] = (
+                metrics.latency_ms.snapshot(),
+                metrics.failures,
+                metrics.calls,
+            )
+            window_calls = metrics.calls - calls
+            if not window_calls:
+                continue
+            p99 = metrics.latency_ms.quantile(0.99, since=counts)
+            if p99 > self.p99_ms:
+                alerts.append(f"{name}: p99 {p99:.0f}ms over {window_calls} calls")
+            failure_rate = (metrics.failures - failures) / window_calls
+            if failure_rate > self.max_failure_rate:
+                alerts.append(
+                    f"{name}: {failure_rate:.0%} of {window_calls} calls failed, last: {metrics.last_error}"
+                )
+        return alerts
+
+
+def render_text(prefix: str, sources: Dict[str, SourceMetrics]) -> str:
+    """prometheus text exposition of sources, labelled source="<name>" """
+    lines = [f"# TYPE {prefix}_latency_ms histogram"]
+    for name, metrics in sources.items():
+        latency = metrics.latency_ms
+        cumulative = 0
+        for bound, n in zip(latency.buckets + ("+Inf",), latency.counts):
+            cumulative += n
+            lines.append(
+                f'{prefix}_latency_ms_bucket{{source="{name}",le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'{prefix}_latency_ms_sum{{source="{name}"}} {latency.sum:.1f}')
+        lines.append(f'{prefix}_latency_ms_count{{source="{name}"}} {latency.count}')
+    for metric, value in [
+        ("payload_total", lambda m: m.payload_total),
+        ("failures_total", lambda m: m.failures),
+    ]:
+        lines.append(f"# TYPE {prefix}_{metric} counter")
+        lines.extend(
+            f'{prefix}_{metric}{{source="{name}"}} {value(metrics)}'
+            for name, metrics in sources.items()
+        )
+    return "\n".join(lines) + "\n"
@@ -1,12 +1,17 @@
+from concurrent.futures import ProcessPoolExecutor
 from configparser import SectionProxy
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 import pandas as pd
 
 from bot_common.bot_config.bot_config import BotConfig
+from bot_common.file_id_cache import FileIdCache
 from bot_common.util import format_white_list
-from bots.book_bot.book_db import init_df
+from bots.book_bot.book_catalog import BookCatalog
+from bots.book_bot.book_index import BookIndex
+from bots.book_bot.book_watcher import BookFolderWatcher
+from bots.book_bot.search_cursor import SearchCursorCache
 
 
 class BookBotConfig(BotConfig):
@@ -19,7 +24,40 @@ class BookBotConfig(BotConfig):
         )
         self.book_path: Path = Path(bot_config_dict["book_folder_path"])
         self.boox_url: str = bot_config_dict["boox_url"]
-        self.recache()
+        self.file_id_cache = FileIdCache(
+            bot_config_dict.get("file_id_cache_path", ":memory:")
+        )
+        snapshot_path = bot_config_dict.get("catalog_snapshot_path", None)
+        self.search_cursors = SearchCursorCache()
+        self.catalog = BookCatalog(
+            self.book_path, Path(snapshot_path) if snapshot_path else None
+        )
+        # a saved snapshot lets polling start right away, reconcile_catalog_job then catches up with the folder
+        self.reconcile_on_start = self.catalog.load_snapshot()
+        if not self.reconcile_on_start:
+            self.recache()
+
+        # parses EPUB/PDF/MOBI metadata off the event loop, see book_metadata_job
+        self.metadata_pool: Optional[ProcessPoolExecutor] = None
+        self.metadata_workers = int(bot_config_dict.get("metadata_workers", 2))
+        # seconds for a batch, a file hanging its worker is quarantined after that
+        self.metadata_timeout = float(bot_config_dict.get("metadata_timeout", 300))
+        if bot_config_dict.get("extract_metadata", "true").lower() == "true":
+            self.metadata_pool = ProcessPoolExecutor(max_workers=self.metadata_workers)
+
+        # optional inotify watcher, requires the watchdog package
+        self.book_watcher: Optional[BookFolderWatcher] = None
+        if bot_config_dict.get("watch_book_folder", "false").lower() == "true":
+            self.book_watcher = BookFolderWatcher(self.book_path)
+            self.book_watcher.start()
+
+    @property
+    def book_df(self) -> pd.DataFrame:
+        return self.catalog.book_df
+
+    @property
+    def book_index(self) -> BookIndex:
+        return self.catalog.book_index
 
     @staticmethod
     def validate_book_df(book_df: pd.DataFrame):
@@ -31,6 +69,17 @@ class BookBotConfig(BotConfig):
                 f"Book DataFrame is missing required columns: {missing_columns}"
             )
 
+    def replace_metadata_pool(self):
+        """new pool for a broken one, or one with a worker stuck in a file"""
+        old_pool = self.metadata_pool
+        self.metadata_pool = ProcessPoolExecutor(max_workers=self.metadata_workers)
+        # shutdown alone would wait for a stuck worker forever, or leave it running
+        for process in list((old_pool._processes or {}).values()):
+            process.terminate()
+        old_pool.shutdown(wait=False, cancel_futures=True)
+
     def recache(self):
-        self.book_df = init_df(self.book_path)
+        """blocking full scan of book_path. /recache uses the non-blocking catalog.refresh instead"""
+        self.catalog.apply(*self.catalog.scan(full=True))
         self.validate_book_df(self.book_df)
+        self.catalog.save_snapshot()
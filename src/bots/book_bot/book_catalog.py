@@ -0,0 +1,352 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import random
+import sqlite3
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from bots.book_bot.book_db import DirState, build_df, diff_tree, scan_tree
+from bots.book_bot.book_index import BookIndex
+from bots.book_bot.book_metadata import BookMetadata, read_metadata
+from bots.book_bot.book_prefix_index import PrefixIndex
+from bots.book_bot.book_snapshot import (
+    CatalogSnapshot,
+    read_metadata_cache,
+    read_snapshot,
+    write_metadata_cache,
+    write_snapshot,
+)
+
+
+class BookCatalog:
+    """
+    book_df and its search index, kept in sync with book_path.
+    scanning the folder is blocking I/O and runs in a worker thread via refresh(),
+    the result is then patched into book_df and book_index on the event loop.
+    book_df labels are stable: a book keeps its label until it is removed.
+    with a snapshot_path, the catalog is persisted after every change and can be loaded back in milliseconds.
+    enrich() merges the author and ISBN embedded in the files into the catalog in the background.
+    """
+
+    def __init__(self, book_path: Path, snapshot_path: Optional[Path] = None):
+        self.book_path = book_path
+        self.snapshot_path = snapshot_path
+        self.book_df: pd.DataFrame = build_df(book_path, [])
+        self.book_index = BookIndex()
+        self.title_index = PrefixIndex()
+        self._tree: Dict[str, DirState] = {}
+        self._labels: Dict[str, int] = {}
+        self._next_label = 0
+        self._refresh_lock = asyncio.Lock()
+        # fullpaths of each category, for random picks without touching book_df
+        self._categories: Dict[str, List[str]] = {}
+        # labels of books whose embedded metadata has not been merged yet
+        self._unenriched: Set[int] = set()
+        self._metadata: Optional[Dict[str, Tuple[int, BookMetadata]]] = None
+        self._metadata_unsaved = False
+
+    def scan(
+        self, dirs: Optional[Iterable[str]] = None, full: bool = False
+    ) -> Tuple[Dict[str, DirState], List[str], List[str]]:
+        """
+        :param dirs: only rescan these directories (and whatever changed below them), default the whole book_path
+        :param full: list every directory again instead of trusting unchanged mtimes
+        :return: new directory tree, files added, files removed
+        """
+        root = str(self.book_path)
+        tops = [root] if dirs is None else self._outermost(dirs, root)
+        tree = dict(self._tree)
+        for top in tops:
+            previous = {} if full else self._tree
+            subtree = scan_tree(Path(top), previous, force=frozenset([top]))
+            prefix = top + os.sep
+            for dir_path in [d for d in tree if d == top or d.startswith(prefix)]:
+                del tree[dir_path]
+            tree.update(subtree)
+        added, removed = diff_tree(self._tree, tree)
+        return tree, added, removed
+
+    def apply(
+        self, tree: Dict[str, DirState], added: List[str], removed: List[str]
+    ) -> Tuple[int, int]:
+        """patch a scan result into book_df and book_index. returns number of books added and removed"""
+        removed_labels = [self._labels.pop(p) for p in removed if p in self._labels]
+        added = [p for p in added if p not in self._labels]
+        labels = range(self._next_label, self._next_label + len(added))
+        self._next_label += len(added)
+        self._labels.update(zip(added, labels))
+        self._tree = tree
+
+        for label in removed_labels:
+            self.book_index.remove(label)
+            self.title_index.remove(label)
+        self._unenriched.difference_update(removed_labels)
+        self._unenriched.update(labels)
+        removed_df = self.book_df.loc[removed_labels, ["fullpath", "category"]]
+        added_df = build_df(self.book_path, added, labels)
+        for label, name in added_df["name"].items():
+            self.book_index.add(label, name)
+        self.title_index.add_many(added_df["name"].items())
+        self.book_df = pd.concat(
+            [
+                df
+                for df in [self.book_df.drop(index=removed_labels), added_df]
+                if not df.empty
+            ]
+            or [added_df]
+        )
+        self._repartition(removed_df, added_df)
+        return len(added), len(removed_labels)
+
+    async def refresh(
+        self, dirs: Optional[Iterable[str]] = None, full: bool = False
+    ) -> Tuple[int, int]:
+        async with self._refresh_lock:
+            result = await asyncio.to_thread(self.scan, dirs, full)
+            added, removed = self.apply(*result)
+            if added or removed:
+                await asyncio.to_thread(self.save_snapshot, self._export())
+        logging.getLogger(__name__).info(
+            f"book catalog refreshed: {added} added, {removed} removed, {len(self.book_df)} books"
+        )
+        return added, removed
+
+    def load_snapshot(self) -> bool:
+        """replace the catalog with the saved snapshot, if there is one for book_path"""
+        if not self.snapshot_path:
+            return False
+        snapshot = read_snapshot(self.snapshot_path, self.book_path)
+        if snapshot is None:
+            return False
+        self.book_df = snapshot.book_df
+        self.book_index = BookIndex.from_postings(
+            self._search_texts(self.book_df), snapshot.postings
+        )
+        self.title_index = PrefixIndex(self.book_df["name"].items())
+        self._tree = snapshot.tree
+        self._labels = dict(zip(self.book_df["fullpath"], self.book_df.index))
+        self._next_label = snapshot.next_label
+        self._unenriched = set(
+            self.book_df.index[
+                (self.book_df["author"] == "") & (self.book_df["isbn"] == "")
+            ]
+        )
+        self._partition()
+        logging.getLogger(__name__).info(
+            f"loaded {len(self.book_df)} books from {self.snapshot_path}"
+        )
+        return True
+
+    async def enrich(
+        self,
+        executor: Executor,
+        batch_size: int = 200,
+        timeout: Optional[float] = None,
+    ) -> int:
+        """
+        merge the author and ISBN embedded in up to batch_size books into book_df and book_index.
+        files are parsed in executor, normally a process pool, files unchanged since they were
+        last parsed come from the metadata cache instead.
+        a file may crash or hang the worker parsing it: when the pool breaks, or the batch is not parsed
+        within timeout seconds, the parsed books are still merged, the others are quarantined, never tried
+        again until a restart, and BrokenProcessPool or TimeoutError is raised, the pool needs replacing
+        :return: number of books still waiting
+        """
+        if not self._unenriched:
+            return 0
+        if self._metadata is None:
+            self._metadata = (
+                await asyncio.to_thread(read_metadata_cache, self.snapshot_path)
+                if self.snapshot_path
+                else {}
+            )
+        labels = list(itertools.islice(self._unenriched, batch_size))
+        self._unenriched.difference_update(labels)
+        try:
+            found, fresh, unparsed = await self._read_batch(executor, labels, timeout)
+        except BaseException:
+            # e.g. a pool broken before the batch: tried again next time, unless removed meanwhile
+            self._unenriched.update(
+                label for label in labels if label in self.book_df.index
+            )
+            raise
+
+        async with self._refresh_lock:
+            self._merge_metadata(found)
+            # under the lock, so it never competes with save_snapshot for the same file
+            if fresh and self.snapshot_path:
+                try:
+                    await asyncio.to_thread(
+                        write_metadata_cache, self.snapshot_path, fresh
+                    )
+                except sqlite3.Error as e:
+                    # merged already, only a restart will parse these files again
+                    logging.getLogger(__name__).warning(
+                        f"failed to cache metadata of {len(fresh)} books: {e}"
+                    )
+            if self._metadata_unsaved and not self._unenriched:
+                await asyncio.to_thread(self.save_snapshot, self._export())
+                self._metadata_unsaved = False
+        if unparsed:
+            # not put back in _unenriched: the same file would break the next pool too
+            logging.getLogger(__name__).warning(
+                f"quarantined {len(unparsed)} books not parsed: {list(unparsed)[:5]}"
+            )
+            errors = list(unparsed.values())
+            raise next(
+                (e for e in errors if isinstance(e, BrokenProcessPool)), errors[0]
+            )
+        return len(self._unenriched)
+
+    async def _read_batch(
+        self, executor: Executor, labels: List[int], timeout: Optional[float]
+    ) -> Tuple[
+        Dict[str, BookMetadata],
+        Dict[str, Tuple[int, BookMetadata]],
+        Dict[str, Exception],
+    ]:
+        """
+        metadata of the books, from the metadata cache or parsed in executor
+        :return: metadata per path, the freshly parsed ones with their mtime, and the paths not parsed
+            because the pool broke or the timeout passed, with that error
+        """
+        paths = self.book_df.loc[labels, "fullpath"].tolist()
+        mtimes = await asyncio.to_thread(self._mtimes, paths)
+        found = {
+            path: self._metadata[path][1]
+            for path, mtime_ns in mtimes.items()
+            if self._metadata.get(path, (None,))[0] == mtime_ns
+        }
+        stale = [path for path in mtimes if path not in found]
+        loop = asyncio.get_running_loop()
+        futures = {
+            loop.run_in_executor(executor, read_metadata, path): path for path in stale
+        }
+        done, pending = (
+            await asyncio.wait(futures, timeout=timeout) if futures else (set(), set())
+        )
+        for future in pending:
+            future.cancel()
+        fresh = {}
+        unparsed: Dict[str, Exception] = {}
+        for future, path in futures.items():
+            if future in pending:
+                unparsed[path] = TimeoutError(f"not parsed within {timeout}s")
+            elif isinstance(future.exception(), BrokenProcessPool):
+                unparsed[path] = future.exception()
+            elif future.exception():
+                raise future.exception()
+            else:
+                fresh[path] = (mtimes[path], future.result())
+        self._metadata.update(fresh)
+        found.update((path, metadata) for path, (_, metadata) in fresh.items())
+        return found, fresh, unparsed
+
+    def _merge_metadata(self, found: Dict[str, BookMetadata]):
+        """books removed while their files were parsed are skipped"""
+        merged = {
+            self._labels[path]: metadata
+            for path, metadata in found.items()
+            if path in self._labels and any(metadata)
+        }
+        if not merged:
+            return
+        self.book_df.loc[list(merged), ["author", "isbn"]] = list(merged.values())
+        for label, metadata in merged.items():
+            self.book_index.extend(label, " ".join(filter(None, metadata)))
+        self._metadata_unsaved = True
+
+    @staticmethod
+    def _mtimes(paths: List[str]) -> Dict[str, int]:
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass  # removed since the last scan
+        return mtimes
+
+    @staticmethod
+    def _search_texts(book_df: pd.DataFrame) -> Iterable[Tuple[int, str]]:
+        """what BookIndex holds per book: the name, then any author and isbn"""
+        for label, *fields in zip(
+            book_df.index, book_df["name"], book_df["author"], book_df["isbn"]
+        ):
+            yield label, " ".join(filter(None, fields))
+
+    @property
+    def categories(self) -> List[str]:
+        return sorted(self._categories)
+
+    def random_books(self, k: int, category: Optional[str] = None) -> List[str]:
+        """
+        fullpaths of up to k distinct random books, fewer when the category is smaller than k
+        :param category: pick only from this category, unknown categories give an empty list
+        """
+        if category is not None:
+            books = self._categories.get(category, [])
+            return random.sample(books, min(k, len(books)))
+        # positions in the categories laid end to end, without building that list
+        categories = list(self._categories.values())
+        ends = list(itertools.accumulate(len(books) for books in categories))
+        total = ends[-1] if ends else 0
+        picks = []
+        for position in random.sample(range(total), min(k, total)):
+            i = bisect.bisect_right(ends, position)
+            picks.append(categories[i][position - (ends[i - 1] if i else 0)])
+        return picks
+
+    def _partition(self):
+        self._categories = {
+            category: books.tolist()
+            for category, books in self.book_df.groupby("category")["fullpath"]
+        }
+
+    def _repartition(self, removed_df: pd.DataFrame, added_df: pd.DataFrame):
+        """patch the categories of the books removed and added, the others are not touched"""
+        for category, books in removed_df.groupby("category")["fullpath"]:
+            removed = set(books)
+            kept = [
+                path
+                for path in self._categories.get(category, [])
+                if path not in removed
+            ]
+            if kept:
+                self._categories[category] = kept
+            else:
+                self._categories.pop(category, None)
+        for category, books in added_df.groupby("category")["fullpath"]:
+            self._categories.setdefault(category, []).extend(books)
+
+    def save_snapshot(self, snapshot: Optional[CatalogSnapshot] = None):
+        """
+        :param snapshot: taken by _export() on the event loop when saving from a worker thread
+        """
+        if self.snapshot_path:
+            write_snapshot(
+                self.snapshot_path, self.book_path, snapshot or self._export()
+            )
+
+    def _export(self) -> CatalogSnapshot:
+        return CatalogSnapshot(
+            self.book_df, self._tree, self.book_index.postings(), self._next_label
+        )
+
+    @staticmethod
+    def _outermost(dirs: Iterable[str], root: str) -> List[str]:
+        """directories under root, dropping any that sit below another one in the list"""
+        tops = []
+        for dir_path in sorted({os.path.normpath(d) for d in dirs}):
+            if not (dir_path == root or dir_path.startswith(root + os.sep)):
+                continue
+            if any(dir_path.startswith(top + os.sep) for top in tops):
+                continue
+            tops.append(dir_path)
+        return tops
@@ -1,23 +1,148 @@
+import os
+import time
 from pathlib import Path
-from typing import List
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
 
 import pandas as pd
 
+from bots.book_bot.book_index import BookIndex
 
-def init_df(working_dir: Path):
-    sub_files = list(working_dir.rglob("*"))
-    book_names = [x.stem for x in sub_files if not x.is_dir()]
-    book_full_paths = [x for x in sub_files if not x.is_dir()]
-    book_categories = [x.relative_to(working_dir).parts[0] for x in book_full_paths]
+# a directory modified this recently may still change within the same mtime tick
+MTIME_SETTLE_NS = 2 * 10**9
+
+
+class DirState(NamedTuple):
+    mtime_ns: int
+    files: Tuple[str, ...]
+    subdirs: Tuple[str, ...]
+
+
+def scan_tree(
+    top: Path,
+    previous: Dict[str, DirState],
+    force: FrozenSet[str] = frozenset(),
+) -> Dict[str, DirState]:
+    """
+    walk the directory tree under top.
+    a directory is only listed again when its mtime differs from the previous scan (or it is in force),
+    otherwise its files and subdirs are taken from previous, so an unchanged tree costs one stat per directory
+    :param top:
+    :param previous: dir path -> DirState from the last scan
+    :param force: dir paths to list regardless of mtime
+    :return: dir path -> DirState for top and every directory below it
+    """
+    current: Dict[str, DirState] = {}
+    now_ns = time.time_ns()
+    stack = [str(top)]
+    while stack:
+        dir_path = stack.pop()
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        state = previous.get(dir_path)
+        if state is None or state.mtime_ns != mtime_ns or dir_path in force:
+            files, subdirs = [], []
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        (subdirs if entry.is_dir() else files).append(entry.name)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if now_ns - mtime_ns < MTIME_SETTLE_NS:
+                mtime_ns = -1  # list it again next time
+            state = DirState(mtime_ns, tuple(sorted(files)), tuple(sorted(subdirs)))
+        current[dir_path] = state
+        stack.extend(
+            os.path.join(dir_path, subdir) for subdir in reversed(state.subdirs)
+        )
+    return current
+
+
+def tree_files(tree: Dict[str, DirState]) -> List[str]:
+    return [
+        os.path.join(dir_path, file_name)
+        for dir_path, state in tree.items()
+        for file_name in state.files
+    ]
+
+
+def diff_tree(
+    previous: Dict[str, DirState], current: Dict[str, DirState]
+) -> Tuple[List[str], List[str]]:
+    """
+    :return: files added and files removed between two scans, only visiting directories that were listed again
+    """
+    added, removed = [], []
+    for dir_path, state in current.items():
+        previous_state = previous.get(dir_path)
+        if previous_state is state:
+            continue
+        previous_files = set(previous_state.files) if previous_state else set()
+        current_files = set(state.files)
+        added.extend(
+            os.path.join(dir_path, f) for f in state.files if f not in previous_files
+        )
+        if previous_state:
+            removed.extend(
+                os.path.join(dir_path, f)
+                for f in previous_state.files
+                if f not in current_files
+            )
+    for dir_path, previous_state in previous.items():
+        if dir_path not in current:
+            removed.extend(os.path.join(dir_path, f) for f in previous_state.files)
+    return added, removed
+
+
+def build_df(
+    working_dir: Path,
+    book_full_paths: List[str],
+    labels: Optional[Iterable[int]] = None,
+) -> pd.DataFrame:
+    """
+    fullpath is kept as str, which is far cheaper to build and load than Path. handlers get Path from to_paths
+    """
+    prefix_len = len(str(working_dir)) + 1
+    book_names = [os.path.splitext(os.path.basename(x))[0] for x in book_full_paths]
+    book_categories = [x[prefix_len:].split(os.sep, 1)[0] for x in book_full_paths]
+    # author and isbn are filled in later from the files' embedded metadata, see BookCatalog.enrich
     df = pd.DataFrame(
-        {"name": book_names, "fullpath": book_full_paths, "category": book_categories}
+        {
+            "name": book_names,
+            "fullpath": book_full_paths,
+            "category": book_categories,
+            "author": [""] * len(book_names),
+            "isbn": [""] * len(book_names),
+        },
+        index=labels,
     )  # schema
     return df
 
 
+def init_df(working_dir: Path):
+    return build_df(working_dir, tree_files(scan_tree(working_dir, {})))
+
+
+def to_paths(full_paths: Iterable[str]) -> List[Path]:
+    return [Path(x) for x in full_paths]
+
+
 def search_book_df(keyword: str, book_df: pd.DataFrame) -> List[Path]:
     return [
-        x["fullpath"]
+        Path(x["fullpath"])
         for idx, x in book_df.iterrows()
         if x["name"].lower().find(keyword.lower()) >= 0
     ]
+
+
+def search_book_index(
+    keywords: str, book_index: BookIndex, book_df: pd.DataFrame
+) -> List[Path]:
+    return to_paths(book_df.loc[book_index.search(keywords), "fullpath"])
+
+
+def fuzzy_search_book_index(
+    keywords: str, book_index: BookIndex, book_df: pd.DataFrame
+) -> List[Path]:
+    return to_paths(book_df.loc[book_index.fuzzy_search(keywords), "fullpath"])
@@ -0,0 +1,142 @@
+import heapq
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+# a posting list, labels as 64-bit integers
+Posting = array
+
+
+class BookIndex:
+    """
+    lowercase character n-gram inverted index over book names.
+    postings map an n-gram to the labels (book_df index) of the books containing it, stored as compact arrays.
+    a query only touches the rarest posting list of each keyword and verifies those
+    candidates by substring, so the cost scales with the matches, not the library.
+    """
+
+    NGRAM = 3
+
+    def __init__(self, names: Iterable[Tuple[int, str]] = ()):
+        """
+        :param names: (label, name) pairs, e.g. book_df["name"].items()
+        """
+        self._texts: Dict[int, str] = {}
+        self._postings: Dict[str, Posting] = defaultdict(lambda: array("q"))
+        self._removed = 0
+        for label, name in names:
+            self.add(label, name)
+
+    @classmethod
+    def from_postings(
+        cls, names: Iterable[Tuple[int, str]], postings: Dict[str, Posting]
+    ) -> "BookIndex":
+        """restore an index exported by postings(), skipping the n-gram pass"""
+        book_index = cls()
+        book_index._texts = {label: name.lower() for label, name in names}
+        book_index._postings.update(postings)
+        return book_index
+
+    def postings(self) -> Dict[str, Posting]:
+        """shallow copy of the posting lists. may still hold labels of removed books"""
+        return dict(self._postings)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    @classmethod
+    def ngrams(cls, text: str) -> Set[str]:
+        return {text[i : i + cls.NGRAM] for i in range(len(text) - cls.NGRAM + 1)}
+
+    def add(self, label: int, name: str):
+        text = name.lower()
+        self._texts[label] = text
+        for gram in self.ngrams(text):
+            self._postings[gram].append(label)
+
+    def extend(self, label: int, extra: str):
+        """append text to an indexed book, e.g. its author, posting only the n-grams it did not have yet"""
+        text = self._texts.get(label)
+        if text is None or not extra:
+            return
+        extended = f"{text} {extra.lower()}"
+        for gram in self.ngrams(extended) - self.ngrams(text):
+            self._postings[gram].append(label)
+        self._texts[label] = extended
+
+    def remove(self, label: int):
+        """drop a book. its stale postings are skipped by search until enough pile up to compact"""
+        if self._texts.pop(label, None) is None:
+            return
+        self._removed += 1
+        if self._removed > max(len(self._texts), 1000) // 4:
+            self.compact()
+
+    def compact(self):
+        live = self._texts
+        self._postings = defaultdict(
+            lambda: array("q"),
+            {
+                gram: kept
+                for gram, posting in self._postings.items()
+                if (kept := array("q", [label for label in posting if label in live]))
+            },
+        )
+        self._removed = 0
+
+    def search(self, keywords: str) -> List[int]:
+        """
+        labels of books whose name contains every whitespace separated keyword, case in-sensitive
+        :param keywords:
+        :return: labels in ascending order
+        """
+        terms = keywords.lower().split()
+        if not terms:
+            return []
+        candidates = self._candidates(terms)
+        return sorted(
+            label
+            for label in candidates
+            if label in self._texts
+            and all(term in self._texts[label] for term in terms)
+        )
+
+    def fuzzy_search(
+        self, query: str, limit: int = 200, min_similarity: float = 0.4
+    ) -> List[int]:
+        """
+        labels ranked by trigram similarity to the query, tolerating typos.
+        books containing every keyword come first, then by the share of the query's n-grams found in the name,
+        then shorter names
+        :param query:
+        :param limit: max number of labels returned
+        :param min_similarity: min share of the query's n-grams a book must contain
+        :return:
+        """
+        terms = query.lower().split()
+        grams = set().union(*(self.ngrams(term) for term in terms))
+        if not grams:
+            return self.search(query)[:limit]
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        threshold = min_similarity * len(grams)
+        ranked = [
+            (not all(term in text for term in terms), -count, len(text), label)
+            for label, count in shared.items()
+            if count >= threshold and (text := self._texts.get(label)) is not None
+        ]
+        return [label for *_, label in heapq.nsmallest(limit, ranked)]
+
+    def _candidates(self, terms: List[str]) -> Iterable[int]:
+        """smallest posting list among all n-grams of all terms"""
+        best = None
+        for term in terms:
+            for gram in self.ngrams(term):
+                posting = self._postings.get(gram)
+                if posting is None:
+                    return []
+                if best is None or len(posting) < len(best):
+                    best = posting
+        # every term is shorter than NGRAM, nothing to narrow down with
+        return self._texts.keys() if best is None else set(best)
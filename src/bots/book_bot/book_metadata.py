@@ -0,0 +1,118 @@
+import os
+import re
+import struct
+import xml.etree.ElementTree as ET
+import zipfile
+from typing import Dict, List, NamedTuple, Optional
+
+# file names like 9780134685991_Effective Java.epub
+ISBN_PREFIX = re.compile(r"^(\d{13}|\d{10})_(.+)$")
+ISBN = re.compile(r"^(\d{13}|\d{9}[\dX])$")
+
+
+class BookMetadata(NamedTuple):
+    author: str = ""
+    isbn: str = ""
+
+
+def isbn_from_name(name: str) -> Optional[str]:
+    """ISBN prefixing a file name, 13 or 10 digits followed by an underscore"""
+    match = ISBN_PREFIX.match(name)
+    return match.group(1) if match else None
+
+
+def move_isbn_to_end(name: str) -> str:
+    """9780134685991_Effective Java.epub -> Effective Java.epub_9780134685991"""
+    match = ISBN_PREFIX.match(name)
+    return f"{match.group(2)}_{match.group(1)}" if match else name
+
+
+def _normalize_isbn(text: Optional[str]) -> Optional[str]:
+    if not text:
+        return None
+    isbn = re.sub(r"^urn:isbn:|[\s-]", "", text.strip(), flags=re.IGNORECASE).upper()
+    return isbn if ISBN.match(isbn) else None
+
+
+def read_metadata(fullpath: str) -> BookMetadata:
+    """
+    author and ISBN embedded in an EPUB, PDF or MOBI/AZW3 file.
+    CPU bound and run in a process pool, so it must stay a picklable module level function.
+    unreadable or unknown files give empty metadata, the ISBN then falls back to the file name prefix
+    """
+    ext = os.path.splitext(fullpath)[1].lower()
+    reader = {".epub": _read_epub, ".pdf": _read_pdf}.get(ext)
+    if ext in {".mobi", ".azw", ".azw3"}:
+        reader = _read_mobi
+    try:
+        metadata = reader(fullpath) if reader else BookMetadata()
+    except Exception:
+        metadata = BookMetadata()
+    if not metadata.isbn:
+        stem = os.path.splitext(os.path.basename(fullpath))[0]
+        metadata = metadata._replace(isbn=isbn_from_name(stem) or "")
+    return metadata
+
+
+def _read_epub(fullpath: str) -> BookMetadata:
+    container_ns = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+    dc = "{http://purl.org/dc/elements/1.1/}"
+    with zipfile.ZipFile(fullpath) as book:
+        container = ET.fromstring(book.read("META-INF/container.xml"))
+        rootfile = container.find(f".//{container_ns}rootfile")
+        opf = ET.fromstring(book.read(rootfile.get("full-path")))
+    authors = [e.text.strip() for e in opf.iter(f"{dc}creator") if e.text]
+    isbns = [_normalize_isbn(e.text) for e in opf.iter(f"{dc}identifier")]
+    return BookMetadata(
+        author=", ".join(authors),
+        isbn=next((isbn for isbn in isbns if isbn), ""),
+    )
+
+
+def _read_pdf(fullpath: str) -> BookMetadata:
+    try:
+        # optional dependency, PDFs are left without metadata when missing
+        from pypdf import PdfReader
+    except ImportError:
+        return BookMetadata()
+    info = PdfReader(fullpath).metadata or {}
+    return BookMetadata(author=str(info.get("/Author", "") or "").strip())
+
+
+# EXTH record types, see https://wiki.mobileread.com/wiki/MOBI#EXTH_Header
+EXTH_AUTHOR, EXTH_ISBN = 100, 104
+
+
+def _read_mobi(fullpath: str) -> BookMetadata:
+    with open(fullpath, "rb") as f:
+        palm_header = f.read(86)
+        if palm_header[60:68] != b"BOOKMOBI":
+            return BookMetadata()
+        (record0_offset,) = struct.unpack(">I", palm_header[78:82])
+        f.seek(record0_offset)
+        record0 = f.read(0x10000)
+    if record0[16:20] != b"MOBI":
+        return BookMetadata()
+    (header_length,) = struct.unpack(">I", record0[20:24])
+    (encoding,) = struct.unpack(">I", record0[28:32])
+    (exth_flags,) = struct.unpack(">I", record0[128:132])
+    codec = "utf-8" if encoding == 65001 else "cp1252"
+
+    exth: Dict[int, List[str]] = {}
+    start = 16 + header_length
+    if exth_flags & 0x40 and record0[start : start + 4] == b"EXTH":
+        (count,) = struct.unpack(">I", record0[start + 8 : start + 12])
+        pos = start + 12
+        for _ in range(count):
+            kind, length = struct.unpack(">II", record0[pos : pos + 8])
+            if length < 8:
+                break
+            value = record0[pos + 8 : pos + length].decode(codec, "replace")
+            exth.setdefault(kind, []).append(value.strip())
+            pos += length
+
+    isbns = [_normalize_isbn(isbn) for isbn in exth.get(EXTH_ISBN, [])]
+    return BookMetadata(
+        author=", ".join(exth.get(EXTH_AUTHOR, [])),
+        isbn=next((isbn for isbn in isbns if isbn), ""),
+    )
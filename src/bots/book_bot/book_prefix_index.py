@@ -0,0 +1,100 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> List[str]:
+    """casefolded words without diacritics, "Les Misérables" -> ["les", "miserables"]"""
+    if text.isascii():
+        return WORD.findall(text.lower())
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return WORD.findall("".join(c for c in decomposed if not unicodedata.combining(c)))
+
+
+class PrefixIndex:
+    """
+    sorted array of (word, label) over the words of book names, for as-you-type queries.
+    every query word is a word prefix, e.g. "harr pot" finds "Harry Potter".
+    the rarest prefix is located by bisect and only its range is walked, stopping after limit matches,
+    so a query costs O(log n + limit) however large the library
+    """
+
+    def __init__(self, names: Iterable[Tuple[int, str]] = ()):
+        """
+        :param names: (label, name) pairs, e.g. book_df["name"].items()
+        """
+        self._words: Dict[int, List[str]] = {}
+        self._keys: List[str] = []
+        self._labels: List[int] = []
+        self._removed = 0
+        self.add_many(names)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add_many(self, names: Iterable[Tuple[int, str]]):
+        """inserts a few books in place, a large batch re-sorts everything in one go"""
+        names = list(names)
+        for label, name in names:
+            self._words[label] = normalize(name)
+        if len(names) > len(self._words) // 8:
+            self._rebuild()
+        else:
+            for label, _ in names:
+                for word in set(self._words[label]):
+                    index = bisect_left(self._keys, word)
+                    self._keys.insert(index, word)
+                    self._labels.insert(index, label)
+
+    def remove(self, label: int):
+        """stale entries are skipped by search until enough pile up to rebuild"""
+        if self._words.pop(label, None) is None:
+            return
+        self._removed += 1
+        if self._removed > max(len(self._words), 1000) // 4:
+            self._rebuild()
+
+    def _rebuild(self):
+        keys, labels = [], []
+        for label, words in self._words.items():
+            unique = set(words)
+            keys.extend(unique)
+            labels.extend([label] * len(unique))
+        # sorting positions by a str key is much faster than sorting (word, label) tuples
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = [keys[i] for i in order]
+        self._labels = [labels[i] for i in order]
+        self._removed = 0
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        start = bisect_left(self._keys, prefix)
+        return start, bisect_left(self._keys, prefix + "\U0010ffff", start)
+
+    def search(self, query: str, limit: int = 50) -> List[int]:
+        """
+        labels of books with a word starting with each query word, in order of the rarest word
+        :param query:
+        :param limit: max number of labels returned
+        """
+        prefixes = normalize(query)
+        if not prefixes:
+            return []
+        start, end = min(
+            (self._range(prefix) for prefix in prefixes), key=lambda r: r[1] - r[0]
+        )
+        labels = []
+        seen = set()
+        for index in range(start, end):
+            label = self._labels[index]
+            words = self._words.get(label)
+            if words is None or label in seen:
+                continue
+            seen.add(label)
+            if all(any(w.startswith(p) for w in words) for p in prefixes):
+                labels.append(label)
+                if len(labels) == limit:
+                    break
+        return labels
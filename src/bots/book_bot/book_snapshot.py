@@ -0,0 +1,157 @@
+import json
+import logging
+import sqlite3
+from array import array
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from bots.book_bot.book_db import DirState
+from bots.book_bot.book_index import Posting
+from bots.book_bot.book_metadata import BookMetadata
+
+SNAPSHOT_VERSION = "2"
+
+# book_df is stored column by column, each column as a single blob.
+# NUL can not appear in a file name, so it safely joins the str columns
+STR_COLUMNS = ["name", "fullpath", "category", "author", "isbn"]
+SEPARATOR = "\0"
+
+
+class CatalogSnapshot(NamedTuple):
+    book_df: pd.DataFrame
+    tree: Dict[str, DirState]
+    postings: Dict[str, Posting]
+    next_label: int
+
+
+def connect(snapshot_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(snapshot_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS columns (name TEXT PRIMARY KEY, data BLOB);
+        CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER, files TEXT, subdirs TEXT);
+        CREATE TABLE IF NOT EXISTS postings (gram TEXT PRIMARY KEY, labels BLOB);
+        CREATE TABLE IF NOT EXISTS metadata (path TEXT PRIMARY KEY, mtime_ns INTEGER, author TEXT, isbn TEXT);
+        """)
+    return conn
+
+
+def _encode(values: List[str]) -> bytes:
+    return SEPARATOR.join(values).encode("utf-8", "surrogateescape")
+
+
+def _decode(data: bytes, count: int) -> List[str]:
+    return data.decode("utf-8", "surrogateescape").split(SEPARATOR) if count else []
+
+
+def write_snapshot(
+    snapshot_path: Path, book_path: Path, snapshot: CatalogSnapshot
+) -> None:
+    """replace the snapshot in one transaction, a crash midway leaves the previous snapshot intact"""
+    book_df = snapshot.book_df
+    live = set(book_df.index)
+    with closing(connect(snapshot_path)) as conn, conn:  # close, and commit/rollback
+        for table in ["meta", "columns", "dirs", "postings"]:
+            conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [
+                ("version", SNAPSHOT_VERSION),
+                ("book_path", str(book_path)),
+                ("next_label", str(snapshot.next_label)),
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO columns VALUES (?, ?)",
+            [("label", array("q", book_df.index.tolist()).tobytes())]
+            + [(column, _encode(book_df[column].tolist())) for column in STR_COLUMNS],
+        )
+        conn.executemany(
+            "INSERT INTO dirs VALUES (?, ?, ?, ?)",
+            (
+                (path, s.mtime_ns, json.dumps(s.files), json.dumps(s.subdirs))
+                for path, s in snapshot.tree.items()
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO postings VALUES (?, ?)",
+            (
+                (gram, kept.tobytes())
+                for gram, posting in snapshot.postings.items()
+                if (kept := array("q", [label for label in posting if label in live]))
+            ),
+        )
+
+
+def read_snapshot(snapshot_path: Path, book_path: Path) -> Optional[CatalogSnapshot]:
+    """None when there is no usable snapshot for book_path"""
+    if not snapshot_path.is_file():
+        return None
+    try:
+        return _read_snapshot(snapshot_path, book_path)
+    except sqlite3.DatabaseError as e:
+        # e.g. truncated on a full disk. set aside, the full rescan writes a new one
+        corrupt_path = snapshot_path.with_name(snapshot_path.name + ".corrupt")
+        logging.getLogger(__name__).warning(
+            f"snapshot {snapshot_path} unreadable, moved to {corrupt_path}: {e}"
+        )
+        snapshot_path.replace(corrupt_path)
+        return None
+
+
+def _read_snapshot(snapshot_path: Path, book_path: Path) -> Optional[CatalogSnapshot]:
+    with closing(connect(snapshot_path)) as conn:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        if meta.get("version") != SNAPSHOT_VERSION or meta.get("book_path") != str(
+            book_path
+        ):
+            return None
+        columns = dict(conn.execute("SELECT name, data FROM columns"))
+        labels = array("q")
+        labels.frombytes(columns["label"])
+        book_df = pd.DataFrame(
+            {column: _decode(columns[column], len(labels)) for column in STR_COLUMNS},
+            index=labels.tolist(),
+        )
+        tree = {
+            path: DirState(
+                mtime_ns, tuple(json.loads(files)), tuple(json.loads(subdirs))
+            )
+            for path, mtime_ns, files, subdirs in conn.execute("SELECT * FROM dirs")
+        }
+        postings = {}
+        for gram, blob in conn.execute("SELECT gram, labels FROM postings"):
+            postings[gram] = array("q")
+            postings[gram].frombytes(blob)
+    return CatalogSnapshot(book_df, tree, postings, int(meta["next_label"]))
+
+
+# the metadata table caches what read_metadata found in each file. unlike the catalog tables it
+# is not replaced by write_snapshot, and it is independent of the snapshot version
+
+
+def read_metadata_cache(snapshot_path: Path) -> Dict[str, Tuple[int, BookMetadata]]:
+    """path -> (mtime_ns, metadata) of every file read so far"""
+    if not snapshot_path.is_file():
+        return {}
+    with closing(connect(snapshot_path)) as conn:
+        return {
+            path: (mtime_ns, BookMetadata(author, isbn))
+            for path, mtime_ns, author, isbn in conn.execute("SELECT * FROM metadata")
+        }
+
+
+def write_metadata_cache(
+    snapshot_path: Path, entries: Dict[str, Tuple[int, BookMetadata]]
+) -> None:
+    with closing(connect(snapshot_path)) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
+            (
+                (path, mtime_ns, metadata.author, metadata.isbn)
+                for path, (mtime_ns, metadata) in entries.items()
+            ),
+        )
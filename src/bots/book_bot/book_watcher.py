@@ -0,0 +1,58 @@
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Set
+
+from telegram.ext import ContextTypes
+
+
+class BookFolderWatcher:
+    """
+    inotify (via the optional watchdog package) on book_path.
+    events only mark their parent directories dirty, book_watch_job rescans those with BookCatalog.refresh
+    """
+
+    WATCHED_EVENTS = {"created", "deleted", "moved"}
+
+    def __init__(self, book_path: Path):
+        # optional dependency, only needed when watch_book_folder is enabled
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class _DirtyDirHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in watcher.WATCHED_EVENTS:
+                    watcher.mark(event.src_path, getattr(event, "dest_path", ""))
+
+        self.book_path = book_path
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self._observer = Observer()
+        self._observer.schedule(_DirtyDirHandler(), str(book_path), recursive=True)
+
+    def mark(self, *paths: str):
+        with self._lock:
+            self._dirty.update(os.path.dirname(path) for path in paths if path)
+
+    def drain(self) -> Set[str]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def start(self):
+        self._observer.daemon = True
+        self._observer.start()
+        logging.getLogger(__name__).info(f"watching {self.book_path}")
+
+    def stop(self):
+        self._observer.stop()
+
+
+async def book_watch_job(context: ContextTypes.DEFAULT_TYPE):
+    bot_config = context.bot_data["bot_config"]
+    dirty = bot_config.book_watcher.drain()
+    if dirty:
+        await bot_config.catalog.refresh(dirty)
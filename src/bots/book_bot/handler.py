@@ -1,9 +1,19 @@
+import asyncio
 import logging
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List
-
-import requests
-from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from typing import List, Optional, Tuple
+
+from telegram import (
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InlineQueryResultCachedDocument,
+    InputTextMessageContent,
+    ReplyKeyboardMarkup,
+    ReplyKeyboardRemove,
+    Update,
+)
+from telegram.error import TelegramError
 from telegram.ext import (
     CommandHandler,
     ContextTypes,
@@ -13,21 +23,68 @@ from telegram.ext import (
 )
 
 from bot_common.common_handler import send_file
+from bot_common.http_upload import (
+    UploadProgress,
+    get_http_client,
+    post_file,
+    report_upload_progress,
+)
+from bot_common.keyboard.button import Button
+from bot_common.keyboard.keyboard_factory import build_keyboard_markup
 from bot_common.util import restricted
 from bots.book_bot.book_bot_config import BookBotConfig
-from bots.book_bot.book_db import search_book_df
+from bots.book_bot.book_db import (
+    fuzzy_search_book_index,
+    search_book_index,
+    to_paths,
+)
+from bots.book_bot.book_metadata import move_isbn_to_end
+
+PAGE_SIZE = 10
+MAX_RESULTS = 200
+INLINE_RESULTS = 50  # telegram's limit per answer
 
 
 async def recache_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Recache the book database."""
-    context.bot_data["bot_config"].recache()
-    await update.message.reply_text("Book database recached.")
+    """Recache the book database. Only changed folders are rescanned unless /recache full."""
+    bot_config: BookBotConfig = context.bot_data["bot_config"]
+    full = bool(context.args) and context.args[0] == "full"
+    added, removed = await bot_config.catalog.refresh(full=full)
+    await update.message.reply_text(
+        f"Book database recached. {added} added, {removed} removed."
+    )
+
+
+async def reconcile_catalog_job(context: ContextTypes.DEFAULT_TYPE):
+    """catch up a catalog loaded from snapshot with the book folder, after the bot is already serving"""
+    await context.bot_data["bot_config"].catalog.refresh()
+
+
+async def book_metadata_job(context: ContextTypes.DEFAULT_TYPE):
+    """merge the next batch of embedded book metadata, so authors and ISBNs become searchable"""
+    bot_config: BookBotConfig = context.bot_data["bot_config"]
+    try:
+        waiting = await bot_config.catalog.enrich(
+            bot_config.metadata_pool, timeout=bot_config.metadata_timeout
+        )
+    except (BrokenProcessPool, TimeoutError) as e:
+        # the books that broke it are quarantined, the next batch gets a new pool
+        logging.getLogger(__name__).error(
+            f"metadata pool replaced after {type(e).__name__}: {e}"
+        )
+        bot_config.replace_metadata_pool()
+        return
+    if waiting:
+        logging.getLogger(__name__).info(f"{waiting} books waiting for metadata")
 
 
 async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
     await update.message.reply_text("""
     Use /search <keywords> to search for a book or /s <keywords> to search for a book.
+    Use /fuzzy <keywords> or /f <keywords> for a ranked search that tolerates typos.
+    Keywords also match authors and ISBNs.
+    Type @<bot name> <title> in any chat to search as you type.
     Use /cancel to cancel the current search.
     """)
 
@@ -38,30 +95,116 @@ async def random_book_handler(
     """Send a random book to the user."""
     RANDOM_BOOKS = 10
     category = context.args[0] if context.args else None
-    book_df = context.bot_data["bot_config"].book_df
-    if category:
-        random_books: list[Path] = (
-            book_df[book_df["category"] == category]
-            .sample(RANDOM_BOOKS)["fullpath"]
-            .tolist()
+    catalog = context.bot_data["bot_config"].catalog
+    random_books: list[Path] = to_paths(catalog.random_books(RANDOM_BOOKS, category))
+    if not random_books:
+        await update.message.reply_text(
+            f"No books in category {category}. Categories: {', '.join(catalog.categories)}"
+            if category
+            else "No books found."
         )
-    else:
-        random_books: list[Path] = book_df.sample(RANDOM_BOOKS)["fullpath"].tolist()
+        return ConversationHandler.END
     await update.message.reply_text(
-        f"Here are {RANDOM_BOOKS} random books:\n"
+        f"Here are {len(random_books)} random books:\n"
         + "\n".join(f"{i + 1}. {book.name}" for i, book in enumerate(random_books))
     )
     context.user_data["search_results"] = random_books
     return SELECT_ACTION
 
 
+@restricted
+async def inline_search_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """
+    answer @bot queries as the user types, from the title prefix index.
+    books already uploaded once come back as their cached document, the rest as a /get command
+    """
+    query = update.inline_query.query
+    bot_config: BookBotConfig = context.bot_data["bot_config"]
+    catalog = bot_config.catalog
+    results = []
+    for label in catalog.title_index.search(query, limit=INLINE_RESULTS):
+        name = catalog.book_df.at[label, "name"]
+        description = " ".join(
+            filter(
+                None,
+                [
+                    catalog.book_df.at[label, "author"],
+                    catalog.book_df.at[label, "category"],
+                ],
+            )
+        )
+        file_id = bot_config.file_id_cache.peek(catalog.book_df.at[label, "fullpath"])
+        if file_id:
+            results.append(
+                InlineQueryResultCachedDocument(
+                    id=str(label),
+                    title=name,
+                    document_file_id=file_id,
+                    description=description,
+                )
+            )
+        else:
+            results.append(
+                InlineQueryResultArticle(
+                    id=str(label),
+                    title=name,
+                    description=description,
+                    input_message_content=InputTextMessageContent(f"/get {label}"),
+                )
+            )
+    await update.inline_query.answer(results, cache_time=30, is_personal=True)
+
+
+@restricted
+async def get_book_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/get <label>, sent by picking a not yet uploaded book from the inline results"""
+    bot_config: BookBotConfig = context.bot_data["bot_config"]
+    book_df = bot_config.book_df
+    try:
+        label = int(context.args[0])
+        fullpath = book_df.at[label, "fullpath"]
+    except (IndexError, ValueError, KeyError):
+        await update.message.reply_text("Book not found, please search again.")
+        return
+    await send_file(Path(fullpath), update, context, bot_config.file_id_cache)
+
+
 # Define states
 SEARCH, SELECT_ACTION, READY_TO_DELIVER = range(3)
 
 
+def render_result_page(
+    results: List[Path], cursor: str, page: int
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """numbered page of search results, numbers count across pages. pager buttons carry the cursor"""
+    page_count = (len(results) - 1) // PAGE_SIZE + 1
+    page = max(0, min(page, page_count - 1))
+    first = page * PAGE_SIZE
+    result_text = (
+        f"Found {len(results)} books (page {page + 1}/{page_count}):\n"
+        + "\n".join(
+            f"{first + i + 1}. {book.name}"
+            for i, book in enumerate(results[first : first + PAGE_SIZE])
+        )
+    )
+    text = f"{result_text}\n\nPlease enter the number of the book you want to select (1-{len(results)}):"
+    buttons = []
+    if page > 0:
+        buttons.append(Button("< Prev", f"page:{cursor}:{page - 1}"))
+    if page < page_count - 1:
+        buttons.append(Button("Next >", f"page:{cursor}:{page + 1}"))
+    return text, build_keyboard_markup([buttons]) if buttons else None
+
+
 @restricted
 async def start_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the conversation and ask user for input."""
+    command = update.message.text.split(" ")[0].split("@")[0]
+    context.user_data["search_mode"] = (
+        "fuzzy" if command in ["/fuzzy", "/f"] else "exact"
+    )
     if not context.args:
         await update.message.reply_text("Please enter keywords to search for a book:")
         context.user_data["search_method"] = "reply"
@@ -75,38 +218,52 @@ async def start_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
 @restricted
 async def search_books(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Search for books based on keywords and show results."""
+    """Search for books based on keywords and show the first page of results."""
     keywords = (
         context.user_data["search_keywords"]
         if context.user_data["search_method"] == "command"
         else update.message.text
     )
-    book_files: List[Path] = search_book_df(
-        keywords, context.bot_data["bot_config"].book_df
+    bot_config: BookBotConfig = context.bot_data["bot_config"]
+    search = (
+        fuzzy_search_book_index
+        if context.user_data.get("search_mode") == "fuzzy"
+        else search_book_index
     )
+    book_files = search(keywords, bot_config.book_index, bot_config.book_df)
+    results: List[Path] = book_files[:MAX_RESULTS]
 
-    if not book_files:
+    if not results:
         await update.message.reply_text(
             "No books found. Please try again with different keywords."
         )
         return ConversationHandler.END
 
-    MAX_ITEMS = 20
-    results: list[Path] = book_files[: min(len(book_files), MAX_ITEMS)]
-
-    # Store results for later use
+    # Store results for later use, the cursor lets the pager page through them without searching again
     context.user_data["search_results"] = results
+    cursor = bot_config.search_cursors.put(results)
+    text, reply_markup = render_result_page(results, cursor, 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
 
-    # Display numbered list of results
-    result_text = "Found these books:\n" + "\n".join(
-        f"{i + 1}. {book.name}" for i, book in enumerate(results)
-    )
+    return SELECT_ACTION
 
-    await update.message.reply_text(
-        f"{result_text}\n\nPlease enter the number of the book you want to select (1-{len(results)}):"
-    )
 
-    return SELECT_ACTION
+@restricted
+async def turn_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Show another page of cached search results.
+    Registered outside book_conv_handler: the cursor is kept server side, so paging works in any state.
+    """
+    query = update.callback_query
+    _, cursor, page = query.data.split(":")
+    results = context.bot_data["bot_config"].search_cursors.get(cursor)
+    if results is None:
+        await query.answer("Search expired, please search again.")
+        return
+    await query.answer()
+    context.user_data["search_results"] = results
+    text, reply_markup = render_result_page(results, cursor, int(page))
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 
 @restricted
@@ -145,24 +302,28 @@ async def handle_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 async def send_to_boox_handler(
     update: Update, context: ContextTypes.DEFAULT_TYPE, selected_book: Path
 ) -> None:
-    """Send the selected book to Boox."""
+    """Stream the selected book to Boox, showing the upload progress in a status message."""
     bot_config: BookBotConfig = context.bot_data["bot_config"]
+    filename = move_isbn_to_end(selected_book.name)
+
+    status_message = await update.message.reply_text("Sending to Boox...")
+    progress = UploadProgress()
+    reporter = asyncio.create_task(
+        report_upload_progress(status_message, "Sending to Boox", progress)
+    )
     try:
-        with open(selected_book, "rb") as f:
-            filename = selected_book.name
-            # Check for ISBN pattern at start (13 or 10 digits followed by underscore)
-            if len(filename) > 14 and filename[:13].isdigit() and filename[13] == "_":
-                # Move 13 digit ISBN to end
-                filename = filename[14:] + "_" + filename[:13]
-            elif len(filename) > 11 and filename[:10].isdigit() and filename[10] == "_":
-                # Move 10 digit ISBN to end
-                filename = filename[11:] + "_" + filename[:10]
-            files = {"file": (filename, f)}
-
-            response = requests.post(bot_config.boox_url, files=files)
-            logging.getLogger(__name__).info(
-                f"Status Code: {response.status_code}, Response: {response.text}"
-            )
+        response = await post_file(
+            get_http_client(context),
+            bot_config.boox_url,
+            selected_book,
+            filename,
+            progress=progress,
+        )
+        logging.getLogger(__name__).info(
+            f"Status Code: {response.status_code}, Response: {response.text}"
+        )
+        # Boox answers an error page too, it is not a delivery
+        response.raise_for_status()
         await update.message.reply_text(response.text)
     except Exception as e:
         logging.getLogger(__name__).error(f"Error sending to Boox: {e}")
@@ -170,6 +331,13 @@ async def send_to_boox_handler(
             "Error sending to Boox", reply_markup=ReplyKeyboardRemove()
         )
         return ConversationHandler.END
+    finally:
+        reporter.cancel()
+        try:
+            await status_message.delete()
+        except TelegramError as e:
+            # e.g. deleted by the user already, must not hide how the upload went
+            logging.getLogger(__name__).warning(f"failed to delete status message: {e}")
 
 
 @restricted
@@ -189,9 +357,9 @@ async def handle_delivery(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if choice == "Send to chat":
         # Send the file directly in chat
-        await send_file(selected_book, update, context)
+        bot_config: BookBotConfig = context.bot_data["bot_config"]
+        await send_file(selected_book, update, context, bot_config.file_id_cache)
     else:  # Send to Boox
-        await update.message.reply_text("Sending to Boox...")
         await send_to_boox_handler(update, context, selected_book)
     await update.message.reply_text(
         "Done! You can start a new search anytime.", reply_markup=ReplyKeyboardRemove()
@@ -211,14 +379,14 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 # Create the conversation handler
 book_conv_handler = ConversationHandler(
     entry_points=[
-        CommandHandler(["search", "s"], start_search),
+        CommandHandler(["search", "s", "fuzzy", "f"], start_search),
         CommandHandler(["random", "r"], random_book_handler),
     ],
     states={
         SEARCH: [MessageHandler(filters.TEXT & ~filters.COMMAND, search_books)],
         SELECT_ACTION: [
             MessageHandler(filters.TEXT & ~filters.COMMAND, handle_selection),
-            CommandHandler(["search", "s"], start_search),
+            CommandHandler(["search", "s", "fuzzy", "f"], start_search),
         ],
         READY_TO_DELIVER: [
             MessageHandler(filters.TEXT & ~filters.COMMAND, handle_delivery)
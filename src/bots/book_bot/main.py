@@ -3,28 +3,55 @@ import sys
 from configparser import SectionProxy
 from typing import Union
 
-from telegram.ext import Application, CommandHandler
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    InlineQueryHandler,
+)
 
 from bot_common.bot_config.bot_config_parser import parse_from_ini
 from bot_common.bot_factory import BotBuilder
+from bot_common.http_upload import close_http_client
 from bots.book_bot.book_bot_config import BookBotConfig
-from bots.book_bot.handler import book_conv_handler, help_handler, recache_handler
+from bots.book_bot.book_watcher import book_watch_job
+from bots.book_bot.handler import (
+    book_conv_handler,
+    book_metadata_job,
+    get_book_handler,
+    help_handler,
+    inline_search_handler,
+    recache_handler,
+    reconcile_catalog_job,
+    turn_page,
+)
 
 
 def build_bot_app(bot_config_dict: Union[dict, SectionProxy]) -> Application:
     bot_config = BookBotConfig(bot_config_dict)
-    bot_app = (
-        BotBuilder(bot_config_dict["bot_token"], bot_config)
-        .add_handlers(
-            [
-                CommandHandler("help", help_handler),
-                CommandHandler("recache", recache_handler),
-                book_conv_handler,
-            ]
-        )
-        .build()
+    bot_builder = BotBuilder(bot_config_dict["bot_token"], bot_config).add_handlers(
+        [
+            CommandHandler("help", help_handler),
+            CommandHandler("recache", recache_handler),
+            CommandHandler("get", get_book_handler),
+            InlineQueryHandler(inline_search_handler),
+            CallbackQueryHandler(turn_page, pattern=r"^page:"),
+            book_conv_handler,
+        ]
     )
-    return bot_app
+    # the Boox uploads share one pooled http client
+    bot_builder.add_post_shutdown([close_http_client])
+    if bot_config.reconcile_on_start:
+        bot_builder.add_onetime_jobs([(reconcile_catalog_job, {"when": 1})])
+    if bot_config.book_watcher:
+        bot_builder.add_repeating_jobs(
+            [(book_watch_job, {"first": 10, "interval": 10})]
+        )
+    if bot_config.metadata_pool:
+        bot_builder.add_repeating_jobs(
+            [(book_metadata_job, {"first": 30, "interval": 5})]
+        )
+    return bot_builder.build()
 
 
 if __name__ == "__main__":
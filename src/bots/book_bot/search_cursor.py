@@ -0,0 +1,35 @@
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+class SearchCursorCache:
+    """
+    search results kept server side under a short cursor id, so paging through them never runs the search again.
+    bounded LRU, a cursor also expires after ttl seconds
+    """
+
+    def __init__(self, max_cursors: int = 256, ttl: float = 3600):
+        self.max_cursors = max_cursors
+        self.ttl = ttl
+        self._cursors: OrderedDict[str, Tuple[float, List[Path]]] = OrderedDict()
+
+    def put(self, results: List[Path]) -> str:
+        cursor = uuid.uuid4().hex[:12]
+        self._cursors[cursor] = (time.monotonic(), results)
+        while len(self._cursors) > self.max_cursors:
+            self._cursors.popitem(last=False)
+        return cursor
+
+    def get(self, cursor: str) -> Optional[List[Path]]:
+        entry = self._cursors.get(cursor)
+        if entry is None:
+            return None
+        created, results = entry
+        if time.monotonic() - created > self.ttl:
+            del self._cursors[cursor]
+            return None
+        self._cursors.move_to_end(cursor)
+        return results
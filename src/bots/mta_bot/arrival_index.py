@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from bots.mta_bot.feed_fetcher import FeedFetcher, StopArrivals
+
+StopKey = Tuple[str, str]  # (stop parent id, direction)
+
+
+class ArrivalIndex:
+    """
+    sorted arrivals per (stop, direction), rebuilt in the background by prefetch_arrivals_job,
+    so next_train_handler answers from memory without waiting for any feed.
+    only hot stops, asked for within hot_ttl seconds, are prefetched: public_transit can only be queried per stop.
+    at most max_hot of them, the least recently asked for is dropped first.
+    double buffered: a rebuild fills a new dict and swaps it in, readers never see a half built index
+    """
+
+    def __init__(
+        self, feed_fetcher: FeedFetcher, hot_ttl: float = 30 * 60, max_hot: int = 100
+    ):
+        self.feed_fetcher = feed_fetcher
+        self.hot_ttl = hot_ttl
+        self.max_hot = max_hot
+        self.built_at = 0.0
+        self._arrivals: Dict[StopKey, StopArrivals] = {}
+        self._hot: "OrderedDict[StopKey, float]" = (
+            OrderedDict()
+        )  # least recently asked first
+
+    def lookup(
+        self, stop_parent_id: str, direction: str, max_age: float
+    ) -> Optional[StopArrivals]:
+        """
+        prefetched arrivals, None if the stop is not prefetched yet, its last prefetch failed
+        or the last rebuild is older than max_age. marks the stop hot either way, so only pass stops known
+        to exist
+        """
+        key = (stop_parent_id, direction)
+        now = time.monotonic()
+        self._hot[key] = now
+        self._hot.move_to_end(key)
+        if len(self._hot) > self.max_hot:
+            self._hot.popitem(last=False)
+        if now - self.built_at > max_age:
+            return None
+        stop_arrivals = self._arrivals.get(key)
+        if stop_arrivals and stop_arrivals.stale_age:
+            # stale when prefetched, and older by now
+            stop_arrivals = stop_arrivals._replace(
+                stale_age=stop_arrivals.stale_age + now - self.built_at
+            )
+        return stop_arrivals
+
+    async def rebuild(self):
+        now = time.monotonic()
+        self._hot = OrderedDict(
+            (key, asked)
+            for key, asked in self._hot.items()
+            if now - asked < self.hot_ttl
+        )
+        keys = list(self._hot)
+        results = await asyncio.gather(
+            *[self.feed_fetcher.query_stop(*key, cached=False) for key in keys],
+            return_exceptions=True,
+        )
+        arrivals = {}
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                # not carried over: lookup() misses, and the live query answers from what is left
+                # of the feed cache, with its age, or tells the data is missing
+                logging.getLogger(__name__).warning(
+                    f"prefetch of {key} failed: {result}"
+                )
+            else:
+                arrivals[key] = result
+        self._arrivals = arrivals
+        self.built_at = now
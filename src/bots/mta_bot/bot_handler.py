@@ -1,18 +1,36 @@
-import itertools
+import asyncio
+import logging
+from datetime import datetime
+from zoneinfo import ZoneInfo
 
-from telegram import Update
-from telegram.ext import ContextTypes
+import telegram
+from telegram import Bot, Update
+from telegram.ext import Application, ContextTypes
 
+from bot_common.metrics import render_text
+from bot_common.util import restricted
+from bots.mta_bot.feed_fetcher import StopArrivals
 from bots.mta_bot.mta_bot_config import MTASubwayBotConfig
-from public_transit.nyc_mta.query.feed_query import (
-    query_stop_and_route,
-    RouteGroup,
-    query_all_stations_for_route,
-)
+from bots.mta_bot.watch import ChatWatches, Watch
 from public_transit.nyc_mta.query.format import format_html
 from public_transit.nyc_mta.query.util import filter_by_time
 
 
+async def query_arrivals(
+    bot_config: MTASubwayBotConfig, stop_parent_id: str, direction: str
+) -> StopArrivals:
+    """sorted arrivals from the prefetched index, or from the feeds when the stop is not prefetched"""
+    # a rebuild older than two intervals means the prefetch job is behind, ask the feeds directly
+    stop_arrivals = bot_config.arrival_index.lookup(
+        stop_parent_id, direction, max_age=2 * bot_config.prefetch_interval
+    )
+    if stop_arrivals is None:
+        stop_arrivals = await bot_config.feed_fetcher.query_stop(
+            stop_parent_id, direction
+        )
+    return stop_arrivals
+
+
 async def next_train_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     accepted query case in-sensitive
@@ -31,7 +49,6 @@ async def next_train_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if query_text != "R":
         stop_parent_id = query_text[:3]
         direction = query_text[-1]
-        context.user_data["last query"] = (stop_parent_id, direction)
     else:
         if "last query" in context.user_data:
             stop_parent_id, direction = context.user_data["last query"]
@@ -39,27 +56,279 @@ async def next_train_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("no previous query")
             return
 
-    direction = {"N": "N", "U": "N", "S": "S", "D": "S"}[direction]
-    stop_arrivals = sorted(
-        list(
-            itertools.chain(
-                *[
-                    query_stop_and_route(
-                        stop_parent_id, direction, route_group, bot_config.api_key
-                    )
-                    for route_group in RouteGroup
-                ]
-            )
-        ),
-        key=lambda item: item[1],
-    )
-    stop_arrivals = filter_by_time(stop_arrivals, bot_config.minute_departure_cap)
+    direction = {"N": "N", "U": "N", "S": "S", "D": "S"}.get(direction)
+    # checked before the lookup, an unknown stop must not be marked hot and prefetched
+    if direction is None or stop_parent_id not in bot_config.stop_id_name_map:
+        await update.message.reply_text(f"unknown stop {query_text}, e.g. A16N")
+        return
+    context.user_data["last query"] = (stop_parent_id, direction)
+    stop_arrivals = await query_arrivals(bot_config, stop_parent_id, direction)
     stop_name = bot_config.stop_id_name_map[stop_parent_id]
     await update.message.reply_text(
-        text=format_html(stop_name, direction, stop_arrivals), parse_mode="HTML"
+        text=format_stop_arrivals(bot_config, stop_name, direction, stop_arrivals),
+        parse_mode="HTML",
+    )
+
+
+def format_stop_arrivals(
+    bot_config: MTASubwayBotConfig,
+    stop_name: str,
+    direction: str,
+    stop_arrivals: StopArrivals,
+) -> str:
+    """arrivals within minute_departure_cap, noting stale or missing route groups"""
+    return (
+        format_html(
+            stop_name,
+            direction,
+            filter_by_time(stop_arrivals.arrivals, bot_config.minute_departure_cap),
+        )
+        + stop_arrivals.note()
+    )
+
+
+async def prefetch_arrivals_job(context: ContextTypes.DEFAULT_TYPE):
+    await context.bot_data["bot_config"].arrival_index.rebuild()
+
+
+async def nearby_station_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    accepted query: a location message. replies with live arrivals, both directions, of the closest stations
+    """
+    bot_config: MTASubwayBotConfig = context.bot_data["bot_config"]
+    location = update.message.location
+    nearby = bot_config.stop_grid.nearest(location.latitude, location.longitude)
+    if not nearby:
+        await update.message.reply_text("no station within 2 km")
+        return
+    queries = [
+        (stop_parent_id, distance, direction)
+        for stop_parent_id, distance in nearby
+        for direction in ["N", "S"]
+    ]
+    results = await asyncio.gather(
+        *[
+            query_arrivals(bot_config, stop_parent_id, direction)
+            for stop_parent_id, _, direction in queries
+        ],
+        return_exceptions=True,
+    )
+    sections = [
+        format_stop_arrivals(
+            bot_config,
+            f"{bot_config.stop_id_name_map[stop_parent_id]} ({stop_parent_id}, {distance:.0f} m)",
+            direction,
+            stop_arrivals,
+        )
+        for (stop_parent_id, distance, direction), stop_arrivals in zip(
+            queries, results
+        )
+        if not isinstance(stop_arrivals, Exception)
+    ]
+    await update.message.reply_text(
+        text="\n\n".join(sections) or "no arrivals", parse_mode="HTML"
     )
 
 
+async def dashboard_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    accepted query:
+    /dash A16N F20S   save the stops as the dashboard of this user and show it
+    /dash             show the saved dashboard
+    dashboards are kept in state_path, across restarts when it is a file
+    """
+    bot_config: MTASubwayBotConfig = context.bot_data["bot_config"]
+    if context.args:
+        stop_keys = []
+        for query_text in context.args:
+            query_text = query_text.upper()
+            direction = {"N": "N", "U": "N", "S": "S", "D": "S"}.get(query_text[-1:])
+            if (
+                len(query_text) != 4
+                or direction is None
+                or query_text[:3] not in bot_config.stop_id_name_map
+            ):
+                await update.message.reply_text(
+                    f"unknown stop {query_text}, e.g. /dash A16N F20S"
+                )
+                return
+            stop_keys.append((query_text[:3], direction))
+        bot_config.dashboards.put(update.effective_user.id, stop_keys)
+    stop_keys = [
+        tuple(stop_key)
+        for stop_key in bot_config.dashboards.get(update.effective_user.id, [])
+    ]
+    if not stop_keys:
+        await update.message.reply_text("no dashboard yet, e.g. /dash A16N F20S")
+        return
+
+    # every stop from the feeds, not some from the prefetched index and some live
+    arrivals = await bot_config.feed_fetcher.query_stops(stop_keys)
+    sections = []
+    for stop_parent_id, direction in stop_keys:
+        stop_name = bot_config.stop_id_name_map[stop_parent_id]
+        stop_arrivals = arrivals[(stop_parent_id, direction)]
+        if isinstance(stop_arrivals, Exception):
+            logging.getLogger(__name__).warning(
+                f"dashboard stop {stop_parent_id}{direction} failed: {stop_arrivals}"
+            )
+            sections.append(f"<b>{stop_name}</b> {direction}: no data")
+        else:
+            sections.append(
+                format_stop_arrivals(bot_config, stop_name, direction, stop_arrivals)
+            )
+    await update.message.reply_text(text="\n\n".join(sections), parse_mode="HTML")
+
+
+async def watch_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    accepted query:
+    /watch A16N 8:05-8:30   arrivals at A16N pushed every day between 8:05 and 8:30, in one pinned message
+    /watch                  list the watches of this chat
+    """
+    bot_config: MTASubwayBotConfig = context.bot_data["bot_config"]
+    chat_id = update.effective_chat.id
+    if not context.args:
+        chat = bot_config.watch_board.chats.get(chat_id)
+        await update.message.reply_text(
+            "\n".join(str(w) for w in chat.watches) if chat else "no watches"
+        )
+        return
+    watch = Watch.parse(" ".join(context.args))
+    if watch is None or watch.stop_parent_id not in bot_config.stop_id_name_map:
+        await update.message.reply_text("usage: /watch A16N 8:05-8:30")
+        return
+    bot_config.watch_board.add(chat_id, watch)
+    await update.message.reply_text(f"watching {watch}")
+
+
+async def unwatch_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    accepted query:
+    /unwatch A16N   remove the watches of A16N
+    /unwatch        remove all watches of this chat
+    """
+    bot_config: MTASubwayBotConfig = context.bot_data["bot_config"]
+    stop_key = None
+    if context.args:
+        query_text = context.args[0].upper()
+        stop_key = (
+            query_text[:3],
+            {"U": "N", "D": "S"}.get(query_text[-1], query_text[-1]),
+        )
+    removed = bot_config.watch_board.remove(update.effective_chat.id, stop_key)
+    await update.message.reply_text(f"removed {removed} watches")
+
+
+async def watch_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    one tick of all /watch subscriptions. every watched stop is looked up once, however many chats watch it,
+    and a chat's pinned message is only edited when its text changed
+    """
+    bot_config: MTASubwayBotConfig = context.bot_data["bot_config"]
+    board = bot_config.watch_board
+    active, stop_keys = board.active(datetime.now(ZoneInfo("America/New_York")))
+    for chat_id, chat in board.chats.items():
+        if chat_id not in active:
+            # window over, the next one starts a new pinned message
+            chat.message_id, chat.text = None, None
+    if not active:
+        return
+
+    stop_keys = list(stop_keys)
+    results = await asyncio.gather(
+        *[query_arrivals(bot_config, *stop_key) for stop_key in stop_keys],
+        return_exceptions=True,
+    )
+    arrivals = dict(zip(stop_keys, results))
+    for chat_id, watches in active.items():
+        sections = []
+        for watch in watches:
+            stop_arrivals = arrivals[(watch.stop_parent_id, watch.direction)]
+            if isinstance(stop_arrivals, Exception):
+                logging.getLogger(__name__).warning(
+                    f"watch {watch} failed: {stop_arrivals}"
+                )
+                continue
+            sections.append(
+                format_stop_arrivals(
+                    bot_config,
+                    bot_config.stop_id_name_map[watch.stop_parent_id],
+                    watch.direction,
+                    stop_arrivals,
+                )
+            )
+        text = "\n\n".join(sections)
+        chat = board.chats.get(chat_id)  # None when unwatched meanwhile
+        if chat and text and text != chat.text:
+            await show_watch_message(context.bot, chat_id, chat, text)
+
+
+async def show_watch_message(bot: Bot, chat_id: int, chat: ChatWatches, text: str):
+    if chat.message_id is not None:
+        try:
+            await bot.edit_message_text(
+                text, chat_id=chat_id, message_id=chat.message_id, parse_mode="HTML"
+            )
+            chat.text = text
+            return
+        except telegram.error.BadRequest as e:
+            if "not modified" in str(e):
+                chat.text = text
+                return
+            # deleted by the user, send a new one
+    message = await bot.send_message(chat_id, text, parse_mode="HTML")
+    chat.message_id, chat.text = message.message_id, text
+    try:
+        await bot.pin_chat_message(
+            chat_id, message.message_id, disable_notification=True
+        )
+    except telegram.error.BadRequest:
+        pass  # no right to pin in this chat, the message still gets edited
+
+
+@restricted
+async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """per route group feed latency, payload and failures, and the feed cache"""
+    feed_fetcher = context.bot_data["bot_config"].feed_fetcher
+    lines = [
+        f"<b>{name}</b> {metrics.summary()}"
+        for name, metrics in sorted(
+            feed_fetcher.metrics.items(),
+            key=lambda item: item[1].latency_ms.max,
+            reverse=True,
+        )
+        if metrics.calls
+    ]
+    lines.append(f"cache: {feed_fetcher.cache}")
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+
+
+@restricted
+async def metrics_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """feed metrics in prometheus text format"""
+    metrics = render_text(
+        "mta_feed", context.bot_data["bot_config"].feed_fetcher.metrics
+    )
+    await update.message.reply_document(
+        metrics.encode("utf-8"), filename="mta_feed_metrics.txt"
+    )
+
+
+async def feed_alert_job(context: ContextTypes.DEFAULT_TYPE):
+    bot_config: MTASubwayBotConfig = context.bot_data["bot_config"]
+    alerts = bot_config.feed_alert.check(bot_config.feed_fetcher.metrics)
+    if alerts:
+        await context.bot.send_message(
+            bot_config.error_notify_chat, "MTA feed alert\n" + "\n".join(alerts)
+        )
+
+
+async def close_feed_recorder(application: Application):
+    """post_shutdown hook of feed_record_dir, records are flushed as they come, this only closes the files"""
+    application.bot_data["bot_config"].feed_fetcher.query.close()
+
+
 async def show_stop_id_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     accepted query:
@@ -81,10 +350,7 @@ async def show_stop_id_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         route = update.message.text[1].upper()
 
-    stops = query_all_stations_for_route(route, bot_config.stop_info_df)
-    msg = "\n".join(
-        [f"{stop['stop_name']} = {stop['stop_id']}" for idx, stop in stops.iterrows()]
-    )
+    msg = bot_config.stop_directory.stations_for_route(route)
     if msg != "":
         await update.message.reply_text(msg, parse_mode="HTML")
 
@@ -102,14 +368,8 @@ async def search_stop_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     bot_config: MTASubwayBotConfig = context.bot_data["bot_config"]
     if (not update) or (not update.message) or (not update.message.text):
         return
-    keyword = update.message.text[2:].lower()
-    stops = bot_config.stop_info_df[
-        bot_config.stop_info_df["stop_name"].str.lower().str.find(keyword) >= 0
-    ][["stop_name", "stop_id"]]
-    msg = "\n".join(
-        [f"{stop['stop_name']} = {stop['stop_id']}" for idx, stop in stops.iterrows()]
-    )
-    if len(msg) > 0:
+    msg = bot_config.stop_directory.search(update.message.text[2:])
+    if msg:
         await update.message.reply_text(msg, parse_mode="HTML")
     else:
         await update.message.reply_text("no such station", parse_mode="HTML")
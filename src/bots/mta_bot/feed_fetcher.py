@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple, Union
+
+from bot_common.async_cache import AsyncTTLCache
+from bot_common.metrics import SourceMetrics
+from bots.mta_bot.feed_recorder import FeedQuery
+from public_transit.nyc_mta.query.feed_query import query_stop_and_route, RouteGroup
+
+
+def merge_arrivals(arrivals_per_route_group: Iterable[list]) -> list:
+    """one list of arrivals, sorted by arrival time"""
+    return sorted(
+        itertools.chain.from_iterable(arrivals_per_route_group),
+        key=lambda item: item[1],
+    )
+
+
+class StopArrivals(NamedTuple):
+    arrivals: list
+    # seconds, the oldest route group answered from the last good result because its feed was late or failing
+    stale_age: float = 0.0
+    # route groups with neither a fresh nor a last good result
+    missing: Tuple[str, ...] = ()
+
+    def note(self) -> str:
+        """a line telling how complete and fresh the arrivals are, empty when they are"""
+        notes = []
+        if self.stale_age >= 1:
+            notes.append(f"some arrivals are {self.stale_age:.0f}s old")
+        if self.missing:
+            notes.append(f"no data for {', '.join(self.missing)}")
+        return f"\n<i>{', '.join(notes)}</i>" if notes else ""
+
+
+class FeedFetcher:
+    """
+    query_stop_and_route is blocking (download and decode of a GTFS-RT feed), so it runs in a bounded thread pool.
+    the feeds of all route groups are fetched concurrently, a query takes as long as the slowest feed
+    instead of the sum of all of them, and the event loop keeps serving other users meanwhile.
+    results are shared by all users for cache_ttl seconds, concurrent identical queries make a single call.
+    the public_transit API only answers per (stop, direction, route group), so that is the cache key.
+    a feed not answering within deadline seconds, or failing, is answered from its last good result, up to
+    stale_ttl seconds old, while its fetch carries on in the background and refreshes the cache
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        max_workers: Optional[int] = None,
+        cache_ttl: float = 30,
+        query: FeedQuery = query_stop_and_route,
+        deadline: Optional[float] = 3,
+        stale_ttl: float = 10 * 60,
+    ):
+        """
+        :param query: query_stop_and_route, or a FeedRecorder / FeedReplay standing in for it
+        """
+        self.api_key = api_key
+        self.query = query
+        self.cache = AsyncTTLCache(ttl=cache_ttl, stale_ttl=stale_ttl)
+        self.deadline = deadline
+        # per route group: time spent in query (download and decode), arrivals returned, failures
+        self.metrics: Dict[str, SourceMetrics] = {
+            route_group.name: SourceMetrics() for route_group in RouteGroup
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(RouteGroup), thread_name_prefix="mta_feed"
+        )
+
+    async def query_route_group(
+        self,
+        stop_parent_id: str,
+        direction: str,
+        route_group: RouteGroup,
+        cached: bool = True,
+    ) -> Tuple[list, float]:
+        """
+        arrivals and their age, which is over cache_ttl when the feed was late or failed and the last good
+        result is returned instead
+        :param cached: False always fetches and waits for it, without deadline, but still falls back
+            to the last good result when the feed fails
+        """
+        return await self.cache.get_within(
+            (route_group, stop_parent_id, direction),
+            lambda: self._fetch(stop_parent_id, direction, route_group),
+            self.deadline if cached else None,
+            refresh=not cached,
+        )
+
+    async def _fetch(
+        self, stop_parent_id: str, direction: str, route_group: RouteGroup
+    ) -> list:
+        metrics = self.metrics[route_group.name]
+        try:
+            arrivals, elapsed = await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                self._timed_query,
+                stop_parent_id,
+                direction,
+                route_group,
+            )
+        except Exception as e:
+            metrics.fail(e)
+            raise
+        metrics.observe(elapsed * 1000, len(arrivals))
+        return arrivals
+
+    def _timed_query(
+        self, stop_parent_id: str, direction: str, route_group: RouteGroup
+    ) -> Tuple[list, float]:
+        """timed in the worker thread, so waiting for a free thread is not counted"""
+        start = time.perf_counter()
+        arrivals = self.query(stop_parent_id, direction, route_group, self.api_key)
+        return arrivals, time.perf_counter() - start
+
+    async def query_stop(
+        self,
+        stop_parent_id: str,
+        direction: str,
+        route_groups: Optional[Iterable[RouteGroup]] = None,
+        cached: bool = True,
+    ) -> StopArrivals:
+        """
+        arrivals at the stop, sorted by arrival time. route groups without any result are left out and
+        listed as missing, only when all of them fail the first failure is raised
+        :param route_groups: default all of them
+        """
+        route_groups = list(route_groups or RouteGroup)
+        results = await asyncio.gather(
+            *[
+                self.query_route_group(stop_parent_id, direction, route_group, cached)
+                for route_group in route_groups
+            ],
+            return_exceptions=True,
+        )
+        answered = [
+            (route_group, result)
+            for route_group, result in zip(route_groups, results)
+            if not isinstance(result, Exception)
+        ]
+        if not answered and results:
+            raise results[0]
+        stale_age = max(
+            [age for _, (_, age) in answered if age > self.cache.ttl], default=0.0
+        )
+        return StopArrivals(
+            merge_arrivals(arrivals for _, (arrivals, _) in answered),
+            stale_age,
+            tuple(
+                rg.name
+                for rg, result in zip(route_groups, results)
+                if isinstance(result, Exception)
+            ),
+        )
+
+    async def query_stops(
+        self, stop_keys: Iterable[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], Union[StopArrivals, Exception]]:
+        """
+        arrivals of several (stop, direction) at once, all queried concurrently through the feed cache,
+        so every stop comes from the same source. a stop whose query failed maps to its exception.
+        public_transit only answers per (stop, direction, route group), it has no call returning a whole
+        route group feed, so each stop still queries every route group on its own: there is no shared
+        feed snapshot, only the cache deduplicating a (stop, direction, route group) already in flight
+        """
+        stop_keys = list(dict.fromkeys(stop_keys))
+        results = await asyncio.gather(
+            *[self.query_stop(*stop_key) for stop_key in stop_keys],
+            return_exceptions=True,
+        )
+        return dict(zip(stop_keys, results))
@@ -0,0 +1,104 @@
+import logging
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Tuple
+
+from public_transit.nyc_mta.query.feed_query import RouteGroup
+
+# same signature as query_stop_and_route: (stop parent id, direction, route group, api key) -> arrivals
+FeedQuery = Callable[[str, str, RouteGroup, str], list]
+
+
+class FeedRecorder:
+    """
+    wraps a feed query and appends every answer to directory, one stream of pickled
+    (stop parent id, direction, arrivals) records per route group, written as they come.
+    the raw GTFS-RT download happens inside public_transit, so the decoded arrivals are what gets recorded
+    """
+
+    def __init__(self, query: FeedQuery, directory: Path):
+        self.query = query
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._files: Dict[RouteGroup, BinaryIO] = {}
+        self._lock = threading.Lock()  # called from the feed thread pool
+
+    def __call__(
+        self, stop_parent_id: str, direction: str, route_group: RouteGroup, api_key: str
+    ) -> list:
+        arrivals = self.query(stop_parent_id, direction, route_group, api_key)
+        record = pickle.dumps((stop_parent_id, direction, arrivals))
+        with self._lock:
+            if route_group not in self._files:
+                self._files[route_group] = self._open(route_group)
+            self._files[route_group].write(record)
+            self._files[route_group].flush()
+        return arrivals
+
+    def _open(self, route_group: RouteGroup) -> BinaryIO:
+        """append to what was recorded before, cutting off a record left unfinished by a killed recorder"""
+        path = _record_path(self.directory, route_group)
+        if path.is_file():
+            _, end = _read_records(path)
+            if end < path.stat().st_size:
+                logging.getLogger(__name__).warning(
+                    f"cut off unfinished record of {path}"
+                )
+                os.truncate(path, end)
+        return open(path, "ab")
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+
+class FeedReplay:
+    """
+    answers feed queries from a FeedRecorder directory without any network access.
+    the last recorded answer of a stop wins, stops never recorded have no arrivals
+    """
+
+    def __init__(self, directory: Path):
+        self.recorded: Dict[RouteGroup, Dict[Tuple[str, str], list]] = {}
+        for route_group in RouteGroup:
+            path = _record_path(directory, route_group)
+            if path.is_file():
+                self.recorded[route_group], end = _read_records(path)
+                if end < path.stat().st_size:
+                    logging.getLogger(__name__).warning(
+                        f"unfinished record at the end of {path}"
+                    )
+        logging.getLogger(__name__).info(
+            f"replaying {sum(len(r) for r in self.recorded.values())} recorded queries from {directory}"
+        )
+
+    def __call__(
+        self, stop_parent_id: str, direction: str, route_group: RouteGroup, api_key: str
+    ) -> list:
+        return self.recorded.get(route_group, {}).get((stop_parent_id, direction), [])
+
+
+def _record_path(directory: Path, route_group: RouteGroup) -> Path:
+    return directory / f"{route_group.name}.records.pkl"
+
+
+def _read_records(path: Path) -> Tuple[Dict[Tuple[str, str], list], int]:
+    """
+    the last recorded arrivals per (stop parent id, direction), and the length of the intact records.
+    a recorder killed mid write leaves an unfinished record after them
+    """
+    recorded = {}
+    end = 0
+    with open(path, "rb") as f:
+        while True:
+            try:
+                stop_parent_id, direction, arrivals = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                break
+            recorded[(stop_parent_id, direction)] = arrivals
+            end = f.tell()
+    return recorded, end
@@ -6,10 +6,21 @@ from telegram.ext import CommandHandler, Application, MessageHandler, filters
 from bot_common.bot_config.bot_config_parser import parse_from_ini
 from bot_common.bot_factory import BotBuilder
 from bots.mta_bot.bot_handler import (
+    close_feed_recorder,
+    dashboard_handler,
+    feed_alert_job,
+    metrics_handler,
+    nearby_station_handler,
     next_train_handler,
+    prefetch_arrivals_job,
     show_stop_id_handler,
+    stats_handler,
     search_stop_handler,
+    unwatch_handler,
+    watch_handler,
+    watch_job,
 )
+from bots.mta_bot.feed_recorder import FeedRecorder
 from bots.mta_bot.mta_bot_config import MTASubwayBotConfig
 
 
@@ -17,22 +28,39 @@ def build_bot_app(bot_config_dict) -> Application:
     logging.getLogger("httpx").setLevel(logging.WARNING)
     bot_config = MTASubwayBotConfig(bot_config_dict)
 
-    bot_app = (
-        BotBuilder(bot_config_dict["bot_token"], bot_config)
-        .add_handlers(
+    bot_builder = BotBuilder(bot_config_dict["bot_token"], bot_config).add_handlers(
+        [
+            CommandHandler("stop", show_stop_id_handler),
+            CommandHandler("dash", dashboard_handler),
+            CommandHandler("stats", stats_handler),
+            CommandHandler("metrics", metrics_handler),
+            CommandHandler("watch", watch_handler),
+            CommandHandler("unwatch", unwatch_handler),
+            MessageHandler(filters.Regex(r"^[Ss]\w$"), show_stop_id_handler),
+            MessageHandler(filters.Regex(r"^[Ss] .+"), search_stop_handler),
+            MessageHandler(filters.Regex(r"^\w\d{2}[NSUDnsud]$"), next_train_handler),
+            MessageHandler(filters.Regex("^[rR]$"), next_train_handler),
+            MessageHandler(filters.LOCATION, nearby_station_handler),
+        ]
+    )  # handlers will be applied in the order defined...if accepted by one handler, it will stop processing more rules
+    bot_builder.add_repeating_jobs(
+        [
+            (watch_job, {"first": 10, "interval": bot_config.watch_interval}),
+            (feed_alert_job, {"first": 300, "interval": 300}),
+        ]
+    )
+    if bot_config.prefetch_interval > 0:
+        bot_builder.add_repeating_jobs(
             [
-                CommandHandler("stop", show_stop_id_handler),
-                MessageHandler(filters.Regex(r"^[Ss]\w$"), show_stop_id_handler),
-                MessageHandler(filters.Regex(r"^[Ss] .+"), search_stop_handler),
-                MessageHandler(
-                    filters.Regex(r"^\w\d{2}[NSUDnsud]$"), next_train_handler
-                ),
-                MessageHandler(filters.Regex("^[rR]$"), next_train_handler),
+                (
+                    prefetch_arrivals_job,
+                    {"first": 5, "interval": bot_config.prefetch_interval},
+                )
             ]
-        )  # handlers will be applied in the order defined...if accepted by one handler, it will stop processing more rules
-        .build()
-    )
-    return bot_app
+        )
+    if isinstance(bot_config.feed_fetcher.query, FeedRecorder):
+        bot_builder.add_post_shutdown([close_feed_recorder])
+    return bot_builder.build()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,20 @@
 from configparser import SectionProxy
+from pathlib import Path
 from typing import Union
 
 import pandas as pd
 
 from bot_common.bot_config.bot_config import BotConfig
+from bot_common.chat_store import ChatStore
+from bot_common.metrics import MetricsAlert
 from bot_common.util import format_white_list
+from bots.mta_bot.arrival_index import ArrivalIndex
+from bots.mta_bot.feed_fetcher import FeedFetcher
+from bots.mta_bot.feed_recorder import FeedQuery, FeedRecorder, FeedReplay
+from bots.mta_bot.stop_directory import StopDirectory
+from bots.mta_bot.stop_grid import StopGrid
+from bots.mta_bot.watch import WatchBoard
+from public_transit.nyc_mta.query.feed_query import query_stop_and_route
 from public_transit.nyc_mta.resource.load_stop_info import load_stop_info
 
 
@@ -18,13 +28,55 @@ class MTASubwayBotConfig(BotConfig):
         )
         self.minute_departure_cap = int(bot_config_dict["minute_departure_cap"])
         self.api_key: str = bot_config_dict["api_key"]
+        # max concurrent feed downloads, default one per route group
+        feed_workers = bot_config_dict.get("feed_workers", None)
+        # seconds a query waits for a feed before answering from its last good result, 0 waits as long as it takes
+        feed_deadline = float(bot_config_dict.get("feed_deadline", 3))
+        self.feed_fetcher = FeedFetcher(
+            self.api_key,
+            int(feed_workers) if feed_workers else None,
+            cache_ttl=float(bot_config_dict.get("feed_cache_ttl", 30)),
+            query=self.feed_query(bot_config_dict),
+            deadline=feed_deadline or None,
+            stale_ttl=float(bot_config_dict.get("feed_stale_ttl", 600)),
+        )
+        self.feed_alert = MetricsAlert(
+            p99_ms=float(bot_config_dict.get("alert_p99_ms", 5000)),
+            max_failure_rate=float(bot_config_dict.get("alert_failure_rate", 0.2)),
+        )
+        # seconds between background rebuilds of the arrival index, 0 disables prefetching
+        self.prefetch_interval = float(bot_config_dict.get("prefetch_interval", 30))
+        self.arrival_index = ArrivalIndex(self.feed_fetcher)
+        # sqlite file keeping /dash dashboards and /watch watches across restarts, default in memory only
+        self.state_path = bot_config_dict.get("state_path", ":memory:")
+        self.dashboards = ChatStore(self.state_path, "dashboards")
+        self.watch_board = WatchBoard(ChatStore(self.state_path, "watches"))
+        self.watch_interval = float(bot_config_dict.get("watch_interval", 30))
 
         stop_info_df: pd.DataFrame = load_stop_info()
-        stop_info_df = stop_info_df[pd.isnull(stop_info_df["parent_station"])][
-            ["stop_id", "stop_name"]
-        ]
+        parent_stations = stop_info_df[pd.isnull(stop_info_df["parent_station"])]
+        self.stop_grid = StopGrid(
+            zip(
+                parent_stations["stop_id"],
+                parent_stations["stop_lat"].astype(float),
+                parent_stations["stop_lon"].astype(float),
+            )
+        )
+        stop_info_df = parent_stations[["stop_id", "stop_name"]]
         stop_info_df["route"] = [x[0] for x in stop_info_df["stop_id"]]
         self.stop_info_df = stop_info_df
-        self.stop_id_name_map = {
-            row["stop_id"]: row["stop_name"] for idx, row in stop_info_df.iterrows()
-        }
+        self.stop_directory = StopDirectory(stop_info_df)
+        self.stop_id_name_map = self.stop_directory.stop_id_name_map
+
+    @staticmethod
+    def feed_query(bot_config_dict: Union[dict, SectionProxy]) -> FeedQuery:
+        """
+        feed_replay_dir answers from recorded feeds without network access, feed_record_dir records live ones
+        """
+        if bot_config_dict.get("feed_replay_dir", None):
+            return FeedReplay(Path(bot_config_dict["feed_replay_dir"]))
+        if bot_config_dict.get("feed_record_dir", None):
+            return FeedRecorder(
+                query_stop_and_route, Path(bot_config_dict["feed_record_dir"])
+            )
+        return query_stop_and_route
@@ -0,0 +1,72 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from public_transit.nyc_mta.query.feed_query import query_all_stations_for_route
+
+WORD = re.compile(r"\w+")
+
+
+class StopDirectory:
+    """
+    every reply of the route lookup handler rendered once at startup, and the station names
+    lowered once so search never scans stop_info_df per message
+    """
+
+    def __init__(self, stop_info_df: pd.DataFrame):
+        """
+        :param stop_info_df: parent stations, with stop_id, stop_name and route columns
+        """
+        stop_ids: List[str] = stop_info_df["stop_id"].tolist()
+        stop_names: List[str] = stop_info_df["stop_name"].tolist()
+        self.stop_id_name_map: Dict[str, str] = dict(zip(stop_ids, stop_names))
+        self._lines = [
+            f"{name} = {stop_id}" for stop_id, name in zip(stop_ids, stop_names)
+        ]
+        self._lower_names = [name.lower() for name in stop_names]
+
+        # positions of the stops having a word starting with the prefix, in stop_info_df order
+        prefixes: Dict[str, List[int]] = defaultdict(list)
+        for position, name in enumerate(self._lower_names):
+            for prefix in {
+                word[:end]
+                for word in WORD.findall(name)
+                for end in range(1, len(word) + 1)
+            }:
+                prefixes[prefix].append(position)
+        self._prefix_positions = dict(prefixes)
+
+        self._route_replies: Dict[str, str] = {}
+        for route in stop_info_df["route"].unique():
+            stops = query_all_stations_for_route(route, stop_info_df)
+            self._route_replies[route] = "\n".join(
+                f"{name} = {stop_id}"
+                for stop_id, name in zip(stops["stop_id"], stops["stop_name"])
+            )
+
+    def _render(self, positions: List[int]) -> str:
+        return "\n".join(self._lines[position] for position in positions)
+
+    def stations_for_route(self, route: str) -> str:
+        """the route's stations as "name = stop id" lines, empty for an unknown route"""
+        return self._route_replies.get(route, "")
+
+    def search(self, keyword: str) -> Optional[str]:
+        """
+        "name = stop id" lines of the stations whose name contains keyword, as the plain substring search did,
+        plus those with a word starting with every word of keyword, e.g. "central grand". None if nothing matches
+        """
+        keyword = keyword.lower().strip()
+        matches = {
+            position
+            for position, name in enumerate(self._lower_names)
+            if keyword in name
+        }
+        words = WORD.findall(keyword)
+        if len(words) > 1 and all(word in self._prefix_positions for word in words):
+            matches.update(
+                set.intersection(*(set(self._prefix_positions[word]) for word in words))
+            )
+        return self._render(sorted(matches)) if matches else None
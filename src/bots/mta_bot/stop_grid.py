@@ -0,0 +1,79 @@
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+EARTH_RADIUS_M = 6_371_000
+
+Stop = Tuple[str, float, float]  # (stop_id, lat, lon)
+
+
+class StopGrid:
+    """
+    stations bucketed into a lat/lon grid of about cell_m meter cells, built once at startup.
+    nearest() only visits the rings of cells around the location until the closest stations are certain,
+    so a lookup never scans all stations
+    """
+
+    def __init__(self, stops: Iterable[Stop], cell_m: float = 500):
+        stops = list(stops)
+        self.cell_m = cell_m
+        self._lat_step = math.degrees(cell_m / EARTH_RADIUS_M)
+        # one lon step for the whole grid, a city spans too little latitude for it to matter
+        mid_lat = sum(lat for _, lat, _ in stops) / len(stops) if stops else 0
+        self._lon_scale = math.cos(math.radians(mid_lat))
+        self._lon_step = self._lat_step / self._lon_scale
+        self._cells: Dict[Tuple[int, int], List[Stop]] = defaultdict(list)
+        for stop in stops:
+            self._cells[self._cell(stop[1], stop[2])].append(stop)
+        rows = [row for row, _ in self._cells] or [0]
+        cols = [col for _, col in self._cells] or [0]
+        self._bounds = min(rows), max(rows), min(cols), max(cols)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self._lat_step), math.floor(lon / self._lon_step)
+
+    def distance_m(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        """equirectangular approximation, accurate to well under a meter at city scale"""
+        dy = math.radians(lat2 - lat1)
+        dx = math.radians(lon2 - lon1) * self._lon_scale
+        return EARTH_RADIUS_M * math.hypot(dx, dy)
+
+    def nearest(
+        self, lat: float, lon: float, k: int = 3, max_distance_m: float = 2000
+    ) -> List[Tuple[str, float]]:
+        """
+        up to k stations within max_distance_m of the location
+        :return: (stop_id, distance in meters), closest first
+        """
+        row, col = self._cell(lat, lon)
+        min_row, max_row, min_col, max_col = self._bounds
+        # rings beyond the last occupied cell or max_distance_m can not hold a match
+        max_ring = min(
+            max(row - min_row, max_row - row, col - min_col, max_col - col),
+            math.ceil(max_distance_m / self.cell_m) + 1,
+        )
+        found: List[Tuple[float, str]] = []
+        for ring in range(max_ring + 1):
+            for cell in _ring(row, col, ring):
+                for stop_id, stop_lat, stop_lon in self._cells.get(cell, ()):
+                    distance = self.distance_m(lat, lon, stop_lat, stop_lon)
+                    if distance <= max_distance_m:
+                        found.append((distance, stop_id))
+            found.sort()
+            # anything in a further ring is at least ring cells away
+            if len(found) >= k and found[k - 1][0] <= ring * self.cell_m:
+                break
+        return [(stop_id, distance) for distance, stop_id in found[:k]]
+
+
+def _ring(row: int, col: int, ring: int) -> Iterable[Tuple[int, int]]:
+    """cells at chebyshev distance ring from (row, col)"""
+    if ring == 0:
+        yield row, col
+        return
+    for d in range(-ring, ring + 1):
+        yield row - ring, col + d
+        yield row + ring, col + d
+    for d in range(-ring + 1, ring):
+        yield row + d, col - ring
+        yield row + d, col + ring
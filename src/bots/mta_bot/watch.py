@@ -0,0 +1,107 @@
+import re
+from datetime import datetime, time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from bot_common.chat_store import ChatStore
+from bots.mta_bot.arrival_index import StopKey
+
+WATCH_PATTERN = re.compile(
+    r"^(\w\d{2})([NSUD])\s+(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$", re.IGNORECASE
+)
+
+
+class Watch(NamedTuple):
+    stop_parent_id: str
+    direction: str
+    start: time
+    end: time
+
+    @classmethod
+    def parse(cls, text: str) -> Optional["Watch"]:
+        """parse "A16N 8:05-8:30" into Watch("A16", "N", 8:05, 8:30), None if not in that form"""
+        match = WATCH_PATTERN.match(text.strip())
+        if not match:
+            return None
+        stop, direction, start_h, start_m, end_h, end_m = match.groups()
+        try:
+            start, end = time(int(start_h), int(start_m)), time(int(end_h), int(end_m))
+        except ValueError:
+            return None
+        direction = {"N": "N", "U": "N", "S": "S", "D": "S"}[direction.upper()]
+        return cls(stop.upper(), direction, start, end)
+
+    def is_active(self, now: time) -> bool:
+        if self.start <= self.end:
+            return self.start <= now <= self.end
+        return now >= self.start or now <= self.end  # window across midnight
+
+    def __str__(self):
+        return (
+            f"{self.stop_parent_id}{self.direction} {self.start:%H:%M}-{self.end:%H:%M}"
+        )
+
+
+class ChatWatches:
+    def __init__(self):
+        self.watches: List[Watch] = []
+        # the pinned message showing the arrivals, and its current text
+        self.message_id: Optional[int] = None
+        self.text: Optional[str] = None
+
+
+class WatchBoard:
+    """
+    /watch subscriptions of all chats. watch_job evaluates every active watch once per tick
+    against a single arrivals lookup per (stop, direction), however many chats watch it
+    """
+
+    def __init__(self, store: Optional[ChatStore] = None):
+        """
+        :param store: keeps the watches across restarts, the pinned messages are not kept
+        """
+        self.store = store if store is not None else ChatStore()
+        self.chats: Dict[int, ChatWatches] = {}
+        for chat_id, watches in self.store.items():
+            for text in watches:
+                watch = Watch.parse(text)
+                if watch:
+                    self.chats.setdefault(chat_id, ChatWatches()).watches.append(watch)
+
+    def add(self, chat_id: int, watch: Watch):
+        chat = self.chats.setdefault(chat_id, ChatWatches())
+        if watch not in chat.watches:
+            chat.watches.append(watch)
+            self.store.put(chat_id, [str(w) for w in chat.watches])
+
+    def remove(self, chat_id: int, stop_key: Optional[StopKey] = None) -> int:
+        """remove the chat's watches of stop_key, or all of them. returns how many were removed"""
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            return 0
+        kept = [
+            w
+            for w in chat.watches
+            if stop_key is not None and (w.stop_parent_id, w.direction) != stop_key
+        ]
+        removed = len(chat.watches) - len(kept)
+        chat.watches = kept
+        if kept:
+            self.store.put(chat_id, [str(w) for w in kept])
+        else:
+            del self.chats[chat_id]
+            self.store.discard(chat_id)
+        return removed
+
+    def active(self, now: datetime) -> Tuple[Dict[int, List[Watch]], Set[StopKey]]:
+        """active watches per chat, and the distinct stops they need"""
+        active = {
+            chat_id: watches
+            for chat_id, chat in self.chats.items()
+            if (watches := [w for w in chat.watches if w.is_active(now.time())])
+        }
+        stop_keys = {
+            (w.stop_parent_id, w.direction)
+            for watches in active.values()
+            for w in watches
+        }
+        return active, stop_keys
@@ -1,16 +1,24 @@
+import asyncio
+import logging
+
+import telegram
 from telegram import Update, BotCommand
 from telegram.ext import ContextTypes
 
+from bot_common.browser_pool import TabPool
+from bot_common.common_handler import init_browser_handler
 from bot_common.util import restricted
+from bots.njt_bot.njt_bot_config import NJTBotConfig
 from public_transit.njtransit.query.bus_and_stop import NJTBusStop
 from public_transit.njtransit.query.bus_api import next_bus_job
 from public_transit.njtransit.query.lightrail_alert import get_hblr_alert
 from public_transit.njtransit.query.path import (
     html_format_path_status_output,
     get_train_status,
-    PathStation,
 )
 
+MYBUSNOW_URL = "https://mybusnow.njtransit.com/"
+
 
 async def init_cmd(context: ContextTypes.DEFAULT_TYPE):
     await context.bot.setMyCommands(
@@ -19,10 +27,28 @@ async def init_cmd(context: ContextTypes.DEFAULT_TYPE):
             BotCommand("/homenj", "Home to NJ Next Bus"),
             BotCommand("/pabt", "PABT to NJ Next Bus"),
             BotCommand("/lr", "Light Rail Alert"),
+            BotCommand("/lrsub", "Push Light Rail Alert Changes"),
+            BotCommand("/lrunsub", "Stop Light Rail Alert Push"),
         ]
     )
 
 
+async def init_browser_and_tab_pool_handler(context: ContextTypes.DEFAULT_TYPE):
+    """start the browser, then the warm tabs next_bus_handler checks out, in one job so they come in order"""
+    await init_browser_handler(context)
+    bot_config: NJTBotConfig = context.bot_data["bot_config"]
+    tab_pool = TabPool(
+        context.bot_data["browser"],
+        size=bot_config.tab_pool_size,
+        warm_url=MYBUSNOW_URL,
+        max_uses=bot_config.tab_max_uses,
+    )
+    context.bot_data["tab_pool"] = tab_pool
+    await tab_pool.warm()
+    # re-warmed on the new browser when the supervisor restarts it
+    context.bot_data["browser_supervisor"].tab_pool = tab_pool
+
+
 @restricted
 async def next_bus_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.text == "/homeny":
@@ -37,19 +63,72 @@ async def next_bus_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(text="unknown command")
         return
-    next_bus_arrival = await next_bus_job(stop, direction, context.bot_data["browser"])
+    tab_pool: TabPool = context.bot_data.get("tab_pool")
+    if tab_pool is None:
+        await update.message.reply_text(
+            text="browser still starting, try again shortly"
+        )
+        return
+
+    async def scrape() -> str:
+        async with tab_pool.checkout() as tab:
+            return await next_bus_job(stop, direction, tab)
+
+    # a burst of the same query makes one scrape, the others wait for it or reuse its result
+    bot_config: NJTBotConfig = context.bot_data["bot_config"]
+    next_bus_arrival = await bot_config.bus_cache.get((stop, direction), scrape)
+    age = bot_config.bus_cache.age((stop, direction)) or 0
+    if age >= 1:
+        next_bus_arrival += f"\n<i>as of {age:.0f}s ago</i>"
     await update.message.reply_text(text=next_bus_arrival, parse_mode="HTML")
 
 
 async def lightrail_alert_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    lightrail_alert = get_hblr_alert()
+    """the alert last polled by lightrail_alert_job, fetched now only before its first poll"""
+    poller = context.bot_data["bot_config"].lightrail_poller
+    if poller.alert is None:
+        poller.update(await asyncio.to_thread(get_hblr_alert))
+    lightrail_alert = poller.alert
+    age = poller.age() or 0
+    if age >= 60:
+        lightrail_alert += f"\n<i>as of {age // 60:.0f} min ago</i>"
     await update.message.reply_text(lightrail_alert, parse_mode="HTML")
     return lightrail_alert
 
 
+async def lightrail_alert_job(context: ContextTypes.DEFAULT_TYPE):
+    """poll the HBLR alert, push it to the subscribed chats when it changed"""
+    poller = context.bot_data["bot_config"].lightrail_poller
+    if poller.update(await asyncio.to_thread(get_hblr_alert)):
+        for chat_id, _ in poller.subscribers.items():
+            try:
+                await context.bot.send_message(chat_id, poller.alert, parse_mode="HTML")
+            except telegram.error.Forbidden:
+                # blocked the bot or removed it from the group
+                poller.subscribers.discard(chat_id)
+            except telegram.error.TelegramError as e:
+                logging.getLogger(__name__).warning(
+                    f"light rail alert push to {chat_id} failed: {e}"
+                )
+
+
+async def lightrail_subscribe_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+):
+    """/lrsub: push light rail alert changes to this chat, /lrunsub: stop it"""
+    poller = context.bot_data["bot_config"].lightrail_poller
+    if update.message.text.startswith("/lrunsub"):
+        poller.subscribers.discard(update.effective_chat.id)
+        await update.message.reply_text("light rail alerts no longer pushed")
+    else:
+        poller.subscribers.put(update.effective_chat.id, True)
+        await update.message.reply_text("light rail alert changes will be pushed")
+
+
 async def path_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    bot_config: NJTBotConfig = context.bot_data["bot_config"]
     station_query = update.message.text[1:]
-    station_map = PathStation.get_station_map()
+    station_map = bot_config.path_station_map
     if not station_query or station_query not in station_map.keys():
         await update.message.reply_text(
             f"unknown station name. choose from f{' '.join(station_map.keys())}"
@@ -57,7 +136,9 @@ async def path_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     current_station = station_map.get(station_query)
-    path_train_status = html_format_path_status_output(
-        current_station, get_train_status(current_station)
+    # get_train_status blocks on the realtime feed, keep it off the event loop
+    train_status = await bot_config.path_cache.get(
+        station_query, lambda: asyncio.to_thread(get_train_status, current_station)
     )
+    path_train_status = html_format_path_status_output(current_station, train_status)
     await update.message.reply_text(path_train_status, parse_mode="HTML")
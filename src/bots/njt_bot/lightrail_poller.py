@@ -0,0 +1,35 @@
+import hashlib
+import time
+from typing import Optional
+
+from bot_common.chat_store import ChatStore
+
+
+class LightRailAlertPoller:
+    """
+    the latest HBLR alert, refreshed by lightrail_alert_job, and the chats subscribed to its changes.
+    changes are detected by content hash, get_hblr_alert has no conditional request to ask the server instead
+    """
+
+    def __init__(self, subscribers: ChatStore):
+        """
+        :param subscribers: chat ids of /lrsub, kept across restarts
+        """
+        self.alert: Optional[str] = None
+        self.digest: Optional[str] = None
+        self.fetched_at: Optional[float] = None
+        self.subscribers = subscribers
+
+    def update(self, alert: str) -> bool:
+        """
+        store a freshly fetched alert
+        :return: whether it changed. the first alert after startup is not a change, nothing is pushed on restart
+        """
+        digest = hashlib.sha256(alert.encode("utf-8")).hexdigest()
+        changed = self.digest is not None and digest != self.digest
+        self.alert, self.digest, self.fetched_at = alert, digest, time.monotonic()
+        return changed
+
+    def age(self) -> Optional[float]:
+        """seconds since the alert was fetched, None before the first fetch"""
+        return time.monotonic() - self.fetched_at if self.fetched_at else None
@@ -3,15 +3,17 @@ import sys
 
 from bot_common.bot_config.bot_config_parser import parse_from_ini
 from bot_common.bot_factory import BotBuilder
-from bot_common.common_handler import init_browser_handler
+from bot_common.common_handler import browser_supervisor_job
 from bots.njt_bot.bot_handler import (
     init_cmd,
+    init_browser_and_tab_pool_handler,
     lightrail_alert_handler,
+    lightrail_alert_job,
+    lightrail_subscribe_handler,
     next_bus_handler,
     path_handler,
 )
 from bots.njt_bot.njt_bot_config import NJTBotConfig
-from public_transit.njtransit.query.path import PathStation
 from telegram.ext import Application, CommandHandler
 
 
@@ -25,11 +27,24 @@ def build_bot_app(bot_config_dict) -> Application:
                 CommandHandler("homenj", next_bus_handler),
                 CommandHandler("pabt", next_bus_handler),
                 CommandHandler("lr", lightrail_alert_handler),
-                CommandHandler(set(PathStation.get_station_map().keys()), path_handler),
+                CommandHandler(["lrsub", "lrunsub"], lightrail_subscribe_handler),
+                CommandHandler(set(bot_config.path_station_map.keys()), path_handler),
+            ]
+        )
+        .add_repeating_jobs(
+            [
+                (
+                    lightrail_alert_job,
+                    {"first": 10, "interval": bot_config.lightrail_interval},
+                ),
+                (browser_supervisor_job, {"first": 60, "interval": 60}),
             ]
         )
         .add_onetime_jobs(
-            [(init_cmd, {"when": 2}), (init_browser_handler, {"when": 1})]
+            [
+                (init_cmd, {"when": 2}),
+                (init_browser_and_tab_pool_handler, {"when": 1}),
+            ]
         )
         .build()
     )
@@ -1,8 +1,12 @@
 from configparser import SectionProxy
 from typing import Union
 
+from bot_common.async_cache import AsyncTTLCache
 from bot_common.bot_config.bot_config import BotConfig
+from bot_common.chat_store import ChatStore
 from bot_common.util import format_white_list
+from bots.njt_bot.lightrail_poller import LightRailAlertPoller
+from public_transit.njtransit.query.path import PathStation
 
 
 class NJTBotConfig(BotConfig):
@@ -13,3 +17,23 @@ class NJTBotConfig(BotConfig):
             white_list_id=format_white_list(bot_config_dict["white_list"]),
             bot_name="NJT Next Bus Bot",
         )
+        # warm tabs for next bus lookups, each recycled after tab_max_uses lookups
+        self.tab_pool_size = int(bot_config_dict.get("tab_pool_size", 3))
+        self.tab_max_uses = int(bot_config_dict.get("tab_max_uses", 50))
+        # next bus predictions per (stop, direction), shared by everyone asking within bus_cache_ttl seconds
+        self.bus_cache = AsyncTTLCache(
+            ttl=float(bot_config_dict.get("bus_cache_ttl", 25))
+        )
+        # PATH station command -> station, built once instead of per command
+        self.path_station_map = PathStation.get_station_map()
+        # train status per station, shared for path_cache_ttl seconds
+        self.path_cache = AsyncTTLCache(
+            ttl=float(bot_config_dict.get("path_cache_ttl", 20))
+        )
+        # seconds between polls of the HBLR alert, pushed to /lrsub chats when it changes
+        self.lightrail_interval = float(bot_config_dict.get("lightrail_interval", 300))
+        # sqlite file keeping /lrsub subscriptions across restarts, default in memory only
+        self.state_path = bot_config_dict.get("state_path", ":memory:")
+        self.lightrail_poller = LightRailAlertPoller(
+            ChatStore(self.state_path, "lightrail_subscribers")
+        )
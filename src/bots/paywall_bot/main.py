@@ -6,6 +6,7 @@ from telegram.ext import Application, CommandHandler
 
 from bot_common.bot_config.bot_config_parser import parse_from_ini
 from bot_common.bot_factory import BotBuilder
+from bot_common.common_handler import browser_supervisor_job, init_browser_handler
 from bots.paywall_bot.bot_handler import unified_command_handler
 from bots.paywall_bot.paywall_bot_config import PaywallBotConfig
 
@@ -24,6 +25,8 @@ def build_bot_app(bot_config_dict) -> Application:
                 CommandHandler(["p", "t"], unified_command_handler),
             ]
         )
+        .add_repeating_jobs([(browser_supervisor_job, {"first": 60, "interval": 60})])
+        .add_onetime_jobs([(init_browser_handler, {"when": 1})])
         .build()
     )
     return bot_app
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from bot_common.async_cache import AsyncTTLCache
+
+
+class TestAsyncTTLCache:
+    @pytest.mark.asyncio
+    async def test_single_flight_and_ttl(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        cache = AsyncTTLCache(ttl=60)
+        # concurrent misses share one fetch
+        assert (
+            await asyncio.gather(*[cache.get("A16", fetch) for _ in range(5)])
+            == [1] * 5
+        )
+        assert await cache.get("A16", fetch) == 1
+        assert (len(calls), cache.misses, cache.hits) == (1, 1, 5)
+        assert cache.age("A16") < 60
+        assert cache.age("F20") is None
+
+        cache.ttl = 0
+        assert await cache.get("A16", fetch) == 2
+
+    @pytest.mark.asyncio
+    async def test_failure_not_cached(self):
+        async def fail():
+            raise ValueError("feed down")
+
+        async def fetch():
+            return "ok"
+
+        cache = AsyncTTLCache(ttl=60, max_entries=1)
+        with pytest.raises(ValueError):
+            await cache.get("A16", fail)
+        assert await cache.get("A16", fetch) == "ok"
+        await cache.get("F20", fetch)
+        assert len(cache) == 1 and cache.age("A16") is None
+
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self):
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "fresh"
+
+        async def fail():
+            raise ValueError("feed down")
+
+        async def fetch():
+            return "good"
+
+        cache = AsyncTTLCache(ttl=0, stale_ttl=60)
+        with pytest.raises(ValueError):
+            await cache.get_within("A16", fail, deadline=0.01)
+        assert await cache.get_within("A16", fetch) == ("good", 0.0)
+
+        # failing and late fetches are answered with the last good value and its age
+        value, age = await cache.get_within("A16", fail, deadline=0.01)
+        assert value == "good" and age >= 0
+        value, _ = await cache.get_within("A16", slow, deadline=0.01)
+        assert value == "good" and cache.stale_hits == 2
+
+        # the late fetch carries on and refreshes the cache
+        release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert cache._entries["A16"][1] == "fresh"
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from bot_common.browser_pool import TabPool
+
+
+class _FakeTab:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+        self.visited = []
+
+    async def get(self, url):
+        await asyncio.sleep(0.01)
+        self.visited.append(url)
+        return self
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakeBrowser:
+    def __init__(self):
+        self.tabs = []
+
+    async def get(self, url, new_tab=False):
+        tab = _FakeTab(self)
+        self.tabs.append(tab)
+        return await tab.get(url)
+
+
+async def _settle():
+    """let the background replacements open their tabs"""
+    await asyncio.sleep(0.05)
+
+
+class TestTabPool:
+    @pytest.mark.asyncio
+    async def test_checkout_in_parallel_and_recycle(self):
+        browser = _FakeBrowser()
+        pool = TabPool(browser, size=2, warm_url="warm", max_uses=3)
+        await pool.warm()
+        assert len(browser.tabs) == 2 and str(pool) == "2/2 tabs open, 2 idle"
+
+        used, held, most_held = [], set(), 0
+
+        async def lookup():
+            nonlocal most_held
+            async with pool.checkout() as tab:
+                assert tab.tab not in held  # never shared by two lookups
+                held.add(tab.tab)
+                used.append(tab.tab)
+                most_held = max(most_held, len(held))
+                await tab.get("eta")
+                held.discard(tab.tab)
+
+        # 6 lookups over 2 tabs, each used 3 times and then replaced
+        await asyncio.gather(*[lookup() for _ in range(6)])
+        await _settle()
+        assert most_held == 2 and set(used) == set(browser.tabs[:2])
+        assert browser.tabs[0].visited == ["warm", "eta", "eta", "eta"]
+        assert all(tab.closed for tab in browser.tabs[:2])
+        assert len(browser.tabs) == 4 and str(pool) == "2/2 tabs open, 2 idle"
+
+    @pytest.mark.asyncio
+    async def test_failed_checkout_replaces_tab(self):
+        browser = _FakeBrowser()
+        pool = TabPool(browser, size=1, warm_url="warm")
+        await pool.warm()
+        with pytest.raises(ValueError):
+            async with pool.checkout():
+                raise ValueError("page changed")
+        await _settle()
+        assert browser.tabs[0].closed and not browser.tabs[1].closed
+        async with pool.checkout() as tab:
+            assert tab.tab is browser.tabs[1]
+
+    @pytest.mark.asyncio
+    async def test_reset_to_restarted_browser(self):
+        old, new = _FakeBrowser(), _FakeBrowser()
+        pool = TabPool(old, size=2, warm_url="warm")
+        await pool.warm()
+        async with pool.checkout() as tab:
+            await pool.reset(new)
+            assert len(new.tabs) == 1  # one slot is still checked out
+        await _settle()
+        # the tab of the old browser is retired when returned
+        assert len(new.tabs) == 2 and str(pool) == "2/2 tabs open, 2 idle"
+        async with pool.checkout() as tab:
+            assert tab.browser is new
+
+    @pytest.mark.asyncio
+    async def test_close_waits_for_replacement(self):
+        browser = _FakeBrowser()
+        pool = TabPool(browser, size=1, warm_url="warm")
+        await pool.warm()
+        with pytest.raises(ValueError):
+            async with pool.checkout():
+                raise ValueError("page changed")
+        # the replacement is still opening its tab
+        await pool.close()
+        assert len(browser.tabs) == 2 and all(tab.closed for tab in browser.tabs)
+        assert str(pool) == "0/1 tabs open, 0 idle"
@@ -0,0 +1,23 @@
+import pytest
+
+from bot_common.chat_store import ChatStore
+
+
+class TestChatStore:
+    def test_persisted(self, tmp_path):
+        db_path = tmp_path / "state.sqlite"
+        store = ChatStore(db_path, "dashboards")
+        store.put(1, [["A16", "N"], ["F20", "S"]])
+        store.put(2, True)
+        store.discard(2)
+        # tables of the same file are independent
+        ChatStore(db_path, "subscribers").put(2, True)
+
+        reloaded = ChatStore(db_path, "dashboards")
+        assert reloaded.get(1) == [["A16", "N"], ["F20", "S"]]
+        assert 2 not in reloaded and len(reloaded) == 1
+        assert dict(ChatStore(db_path, "subscribers").items()) == {2: True}
+
+    def test_invalid_table(self):
+        with pytest.raises(ValueError):
+            ChatStore(table="x; DROP TABLE y")
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bot_common.common_handler import send_file
+from bot_common.file_id_cache import FileIdCache
+
+
+class _FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_document(self, chat_id, document):
+        self.sent.append(document)
+        return SimpleNamespace(document=SimpleNamespace(file_id="file-id-1"))
+
+
+class _FakeMessage:
+    chat_id = 1
+
+    async def reply_text(self, text, **kwargs):
+        return self
+
+    async def delete(self):
+        pass
+
+
+class TestCommonHandler:
+    @pytest.mark.asyncio
+    async def test_send_file_reuses_file_id(self, tmp_path, monkeypatch):
+        book = tmp_path / "book.epub"
+        book.write_bytes(b"v1")
+        bot = _FakeBot()
+        update = SimpleNamespace(message=_FakeMessage())
+        context = SimpleNamespace(bot=bot)
+        # an empty cache is still a cache
+        cache = FileIdCache()
+
+        await send_file(book, update, context, cache)
+        assert cache.peek(book) == "file-id-1"
+
+        def no_open(*args, **kwargs):
+            raise AssertionError("unchanged file opened again")
+
+        monkeypatch.setattr("bot_common.common_handler.open", no_open, raising=False)
+        await send_file(book, update, context, cache)
+        assert bot.sent[1] == "file-id-1" and len(bot.sent) == 2
@@ -0,0 +1,31 @@
+import os
+
+from bot_common.file_id_cache import FileIdCache
+
+
+class TestFileIdCache:
+    def test_persisted_and_invalidated_on_change(self, tmp_path):
+        book = tmp_path / "book.epub"
+        book.write_bytes(b"v1")
+        cache = FileIdCache(tmp_path / "file_ids.sqlite")
+        assert cache.get(book, book.stat()) is None
+        cache.put(book, book.stat(), "file-id-1")
+
+        reloaded = FileIdCache(tmp_path / "file_ids.sqlite")
+        assert reloaded.get(book, book.stat()) == "file-id-1"
+
+        book.write_bytes(b"v2 is longer")
+        assert reloaded.get(book, book.stat()) is None
+        assert len(reloaded) == 0
+        assert len(FileIdCache(tmp_path / "file_ids.sqlite")) == 0
+
+    def test_mtime_change_invalidates(self, tmp_path):
+        book = tmp_path / "book.epub"
+        book.write_bytes(b"v1")
+        cache = FileIdCache()
+        cache.put(book, book.stat(), "file-id-1")
+        os.utime(book, ns=(1, 1))
+        # peek does not look at the file
+        assert cache.peek(str(book)) == "file-id-1"
+        assert cache.get(book, book.stat()) is None
+        assert cache.peek(book) is None
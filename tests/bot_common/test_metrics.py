@@ -0,0 +1,33 @@
+import math
+
+from bot_common.metrics import Histogram, MetricsAlert, SourceMetrics, render_text
+
+
+class TestMetrics:
+    def test_histogram_quantile(self):
+        histogram = Histogram(buckets=(10, 100, 1000))
+        assert math.isnan(histogram.quantile(0.5))
+        for value in [5] * 98 + [50, 3000]:
+            histogram.observe(value)
+        assert histogram.quantile(0.5) == 10
+        assert histogram.quantile(0.99) == 100
+        assert histogram.quantile(1) == 3000  # +inf bucket reports the max
+        since = histogram.snapshot()
+        histogram.observe(500)
+        assert histogram.quantile(0.5, since=since) == 1000
+
+    def test_alert_on_window(self):
+        sources = {"ACE": SourceMetrics(), "G": SourceMetrics()}
+        alert = MetricsAlert(p99_ms=1000, max_failure_rate=0.2)
+        sources["ACE"].observe(20000, 3)
+        sources["G"].observe(20, 3)
+        assert alert.check(sources) == ["ACE: p99 30000ms over 1 calls"]
+        # only what happened since the last check counts
+        sources["ACE"].observe(20, 3)
+        sources["G"].fail(TimeoutError("feed down"))
+        assert alert.check(sources) == [
+            "G: 100% of 1 calls failed, last: TimeoutError: feed down"
+        ]
+        assert 'mta_feed_failures_total{source="G"} 1' in render_text(
+            "mta_feed", sources
+        )
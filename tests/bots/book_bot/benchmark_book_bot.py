@@ -0,0 +1,156 @@
+"""
+benchmark of the book catalog on synthetic libraries. not collected by pytest, run it directly:
+
+    PYTHONPATH=src python tests/bots/book_bot/benchmark_book_bot.py --sizes 10000,100000 --out book_bench.json
+
+prints one JSON document with a result per library size, so runs can be diffed to track regressions
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from bots.book_bot.book_catalog import BookCatalog
+from bots.book_bot.book_db import init_df, search_book_df, search_book_index
+
+WORDS = (
+    "sea old man war peace time history python data night river city garden "
+    "stars light dark king queen house love death code science art music world"
+).split()
+CATEGORIES = [f"category{i:02d}" for i in range(20)]
+BOOKS_PER_DIR = 200
+# iterrows is far too slow to time on large libraries
+LEGACY_SEARCH_MAX_BOOKS = 20000
+
+
+def make_library(root: Path, size: int, seed: int = 0) -> List[str]:
+    """size empty book files, spread over categories and sub folders of BOOKS_PER_DIR. returns the book names"""
+    rng = random.Random(seed)
+    names = []
+    for i in range(size):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        shelf = i // (BOOKS_PER_DIR * len(CATEGORIES))
+        folder = root / category / f"shelf{shelf:05d}"
+        if i % (BOOKS_PER_DIR * len(CATEGORIES)) < len(CATEGORIES):
+            folder.mkdir(parents=True)
+        name = " ".join(rng.choices(WORDS, k=4)) + f" {i}"
+        (folder / f"{name}.{rng.choice(['epub', 'pdf', 'mobi'])}").touch()
+        names.append(name)
+    return names
+
+
+def timed(func: Callable, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def latencies(func: Callable, queries: List[str]) -> Dict[str, float]:
+    """latency percentiles in milliseconds over queries"""
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": statistics.median(samples),
+        "p90_ms": samples[int(len(samples) * 0.9)],
+        "p99_ms": samples[int(len(samples) * 0.99)],
+        "max_ms": samples[-1],
+    }
+
+
+def queries_for(names: List[str], count: int, seed: int = 1) -> List[str]:
+    """mix of one and two word queries, partial words, and misses"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = rng.choice(names).split()
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(rng.choice(words[:-1]))
+        elif kind < 0.8:
+            queries.append(" ".join(rng.sample(words, 2)))
+        elif kind < 0.9:
+            queries.append(rng.choice(words)[:3])
+        else:
+            queries.append("xyzzy")
+    return queries
+
+
+def run(size: int, query_count: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        book_path = Path(tmp) / "books"
+        names = make_library(book_path, size)
+        result = {"size": size}
+
+        tracemalloc.start()
+        catalog = BookCatalog(book_path, Path(tmp) / "catalog.sqlite")
+        result["build_s"] = timed(lambda: catalog.apply(*catalog.scan(full=True)))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["catalog_mb"] = current / 0x100000
+        result["build_peak_mb"] = peak / 0x100000
+        result["init_df_s"] = timed(init_df, book_path)
+
+        result["recache_unchanged_s"] = timed(asyncio.run, catalog.refresh())
+        for i in range(10):
+            (book_path / CATEGORIES[0] / "shelf00000" / f"added {i}.epub").touch()
+        result["recache_10_added_s"] = timed(asyncio.run, catalog.refresh())
+        result["recache_full_s"] = timed(asyncio.run, catalog.refresh(full=True))
+
+        result["snapshot_save_s"] = timed(catalog.save_snapshot)
+        loaded = BookCatalog(book_path, Path(tmp) / "catalog.sqlite")
+        result["snapshot_load_s"] = timed(loaded.load_snapshot)
+
+        queries = queries_for(names, query_count)
+        book_df, book_index = catalog.book_df, catalog.book_index
+        result["search"] = latencies(
+            lambda q: search_book_index(q, book_index, book_df), queries
+        )
+        result["fuzzy_search"] = latencies(book_index.fuzzy_search, queries)
+        result["prefix_search"] = latencies(catalog.title_index.search, queries)
+        result["random_books"] = latencies(
+            lambda q: catalog.random_books(10, CATEGORIES[len(q) % len(CATEGORIES)]),
+            queries,
+        )
+        if size <= LEGACY_SEARCH_MAX_BOOKS:
+            result["legacy_search_book_df"] = latencies(
+                lambda q: search_book_df(q, book_df), queries[:20]
+            )
+        return result
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--out", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "runs": [],
+    }
+    for size in [int(s) for s in args.sizes.split(",")]:
+        print(f"benchmarking {size} books", file=sys.stderr)
+        results["runs"].append(run(size, args.queries))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.out:
+        Path(args.out).write_text(output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
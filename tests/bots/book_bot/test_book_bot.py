@@ -1,3 +1,372 @@
+import asyncio
+import os
+import zipfile
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pandas as pd
+import pytest
+from telegram import InlineQueryResultArticle, InlineQueryResultCachedDocument
+from telegram.error import BadRequest
+
+from bot_common.file_id_cache import FileIdCache
+from bot_common.http_upload import close_http_client
+from bots.book_bot.book_catalog import BookCatalog
+from bots.book_bot.book_db import (
+    diff_tree,
+    init_df,
+    scan_tree,
+    search_book_df,
+    search_book_index,
+)
+from bots.book_bot.book_index import BookIndex
+from bots.book_bot.book_metadata import BookMetadata, move_isbn_to_end, read_metadata
+from bots.book_bot.book_prefix_index import PrefixIndex
+from bots.book_bot.handler import inline_search_handler, send_to_boox_handler
+from bots.book_bot.search_cursor import SearchCursorCache
+
+
+def _write_epub(path: Path, author: str, isbn: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, "w") as book:
+        book.writestr(
+            "META-INF/container.xml",
+            '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf"/></rootfiles></container>',
+        )
+        book.writestr(
+            "OEBPS/content.opf",
+            '<package xmlns="http://www.idpf.org/2007/opf" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f"<metadata><dc:creator>{author}</dc:creator><dc:identifier>uuid:1</dc:identifier>"
+            f"<dc:identifier>urn:isbn:{isbn}</dc:identifier></metadata></package>",
+        )
+
+
+def _touch(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+
+
+def _book_df(names):
+    return pd.DataFrame(
+        {
+            "name": names,
+            "fullpath": [Path("/books/fiction") / f"{name}.epub" for name in names],
+            "category": ["fiction"] * len(names),
+        }
+    )
+
+
+class _PoisonExecutor(Executor):
+    """parses in the caller, a "crash" file breaks the pool and a "hang" file never finishes"""
+
+    def submit(self, fn, path):
+        future = Future()
+        if "crash" in path:
+            future.set_exception(BrokenProcessPool("worker died"))
+        elif "hang" not in path:
+            future.set_result(fn(path))
+        return future
+
+
+class _FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+    async def delete(self):
+        raise BadRequest("Message to delete not found")
+
+
 class TestBookBot:
     def test_book_bot(self):
         pass
+
+    def test_index_search_matches_scan(self):
+        book_df = _book_df(
+            ["The Old Man and the Sea", "Sea of Tranquility", "Old Yeller", "Dune"]
+        )
+        book_index = BookIndex(book_df["name"].items())
+        for keyword in ["sea", "OLD", "une", "d", "tranquility", "xyz"]:
+            assert search_book_index(keyword, book_index, book_df) == search_book_df(
+                keyword, book_df
+            )
+
+    def test_index_search_intersects_keywords(self):
+        book_df = _book_df(
+            ["The Old Man and the Sea", "Sea of Tranquility", "Old Yeller"]
+        )
+        book_index = BookIndex(book_df["name"].items())
+        assert book_index.search("sea old") == [0]
+        assert book_index.search("sea  of") == [1]
+        assert book_index.search("old missing") == []
+        assert book_index.search("  ") == []
+
+    def test_init_df(self, tmp_path):
+        for book in ["fiction/a.epub", "fiction/sub/b.pdf", "science/c.mobi"]:
+            _touch(tmp_path / book)
+        book_df = init_df(tmp_path)
+        assert sorted(book_df["name"]) == ["a", "b", "c"]
+        assert dict(zip(book_df["name"], book_df["category"])) == {
+            "a": "fiction",
+            "b": "fiction",
+            "c": "science",
+        }
+
+    def test_scan_tree_reuses_unchanged_dirs(self, tmp_path):
+        _touch(tmp_path / "fiction/a.epub")
+        _touch(tmp_path / "science/c.mobi")
+        old_ns = 1_000_000_000
+        for d in [tmp_path, tmp_path / "fiction", tmp_path / "science"]:
+            os.utime(d, ns=(old_ns, old_ns))
+        tree = scan_tree(tmp_path, {})
+
+        _touch(tmp_path / "fiction/new.epub")
+        (tmp_path / "science/c.mobi").unlink()
+        os.utime(tmp_path / "science", ns=(old_ns, old_ns))  # change goes unnoticed
+        new_tree = scan_tree(tmp_path, tree)
+        assert new_tree[str(tmp_path / "science")] is tree[str(tmp_path / "science")]
+        assert diff_tree(tree, new_tree) == ([str(tmp_path / "fiction/new.epub")], [])
+
+        forced = scan_tree(tmp_path, tree, force=frozenset([str(tmp_path / "science")]))
+        assert diff_tree(tree, forced)[1] == [str(tmp_path / "science/c.mobi")]
+
+    def test_catalog_refresh(self, tmp_path):
+        _touch(tmp_path / "fiction/sea.epub")
+        _touch(tmp_path / "science/stars.pdf")
+        catalog = BookCatalog(tmp_path)
+        assert catalog.apply(*catalog.scan(full=True)) == (2, 0)
+
+        _touch(tmp_path / "fiction/more sea.epub")
+        for path in (tmp_path / "science").iterdir():
+            path.unlink()
+        (tmp_path / "science").rmdir()
+        # rescanning only the touched folders picks up both changes
+        assert catalog.apply(
+            *catalog.scan([str(tmp_path / "fiction"), str(tmp_path)])
+        ) == (1, 1)
+        assert sorted(catalog.book_df["name"]) == ["more sea", "sea"]
+        assert search_book_index("sea", catalog.book_index, catalog.book_df) == [
+            tmp_path / "fiction/sea.epub",
+            tmp_path / "fiction/more sea.epub",
+        ]
+        assert catalog.book_index.search("stars") == []
+        assert catalog.apply(*catalog.scan(full=True)) == (0, 0)
+
+    def test_catalog_snapshot_round_trip(self, tmp_path):
+        book_path = tmp_path / "books"
+        _touch(book_path / "fiction/sea.epub")
+        _touch(book_path / "fiction/old sea.epub")
+        catalog = BookCatalog(book_path, tmp_path / "catalog.sqlite")
+        catalog.apply(*catalog.scan(full=True))
+        catalog.save_snapshot()
+
+        loaded = BookCatalog(book_path, tmp_path / "catalog.sqlite")
+        assert loaded.load_snapshot()
+        pd.testing.assert_frame_equal(loaded.book_df, catalog.book_df)
+        assert loaded.book_index.search("sea") == catalog.book_index.search("sea")
+
+        (book_path / "fiction/sea.epub").unlink()
+        _touch(book_path / "fiction/new sea.epub")
+        assert loaded.apply(*loaded.scan()) == (1, 1)
+        assert loaded.book_df["name"].to_dict() == {0: "old sea", 2: "new sea"}
+
+        assert not BookCatalog(tmp_path, tmp_path / "catalog.sqlite").load_snapshot()
+
+        # a corrupt snapshot is set aside, and the next one written from scratch
+        (tmp_path / "catalog.sqlite").write_bytes(b"truncated on a full disk" * 100)
+        corrupt = BookCatalog(book_path, tmp_path / "catalog.sqlite")
+        assert not corrupt.load_snapshot()
+        assert (tmp_path / "catalog.sqlite.corrupt").is_file()
+        corrupt.apply(*corrupt.scan(full=True))
+        corrupt.save_snapshot()
+        assert BookCatalog(book_path, tmp_path / "catalog.sqlite").load_snapshot()
+
+    def test_fuzzy_search(self):
+        book_index = BookIndex()
+        for label, name in enumerate(
+            ["Harry Potter and the Chamber of Secrets", "Harry Potter", "Pottery"]
+        ):
+            book_index.add(label, name)
+        # typos still match, exact matches of every keyword first, then shorter names
+        assert book_index.fuzzy_search("hary poter")[:2] == [1, 0]
+        assert book_index.fuzzy_search("harry potter") == [1, 0, 2]
+        assert book_index.fuzzy_search("harry", limit=1) == [1]
+        assert book_index.fuzzy_search("xyzzy") == []
+
+    def test_search_cursor_cache(self):
+        cursors = SearchCursorCache(max_cursors=2)
+        first = cursors.put([Path("a.epub")])
+        second = cursors.put([Path("b.epub")])
+        assert cursors.get(first) == [Path("a.epub")]
+        cursors.put([Path("c.epub")])  # evicts second, first was used more recently
+        assert cursors.get(second) is None
+        assert cursors.get(first) == [Path("a.epub")]
+        cursors.ttl = -1
+        assert cursors.get(first) is None
+
+    def test_catalog_random_books(self, tmp_path):
+        for i in range(12):
+            _touch(tmp_path / f"fiction/novel {i}.epub")
+        _touch(tmp_path / "science/stars.pdf")
+        catalog = BookCatalog(tmp_path)
+        catalog.apply(*catalog.scan(full=True))
+        assert catalog.categories == ["fiction", "science"]
+        picks = catalog.random_books(10)
+        assert len(set(picks)) == 10
+        # a category smaller than k gives every book once
+        assert catalog.random_books(10, "science") == [
+            str(tmp_path / "science/stars.pdf")
+        ]
+        assert catalog.random_books(10, "poetry") == []
+
+        (tmp_path / "science/stars.pdf").unlink()
+        catalog.apply(*catalog.scan())
+        assert catalog.random_books(10, "science") == []
+        assert catalog.categories == ["fiction"]
+        assert len(catalog.random_books(20)) == 12
+
+        # only the touched categories are patched, the result is the same as a full rebuild
+        _touch(tmp_path / "fiction/novel 12.epub")
+        _touch(tmp_path / "poetry/odes.epub")
+        (tmp_path / "fiction/novel 0.epub").unlink()
+        catalog.apply(*catalog.scan(full=True))
+        assert catalog.categories == ["fiction", "poetry"]
+        assert set(catalog.random_books(20)) == set(catalog.book_df["fullpath"])
+        assert len(catalog.random_books(20, "fiction")) == 12
+
+    def test_read_metadata(self, tmp_path):
+        _write_epub(tmp_path / "sea.epub", "Ernest Hemingway", "978-0-684-80122-3")
+        assert read_metadata(str(tmp_path / "sea.epub")) == BookMetadata(
+            "Ernest Hemingway", "9780684801223"
+        )
+        # no embedded metadata, the isbn comes from the file name
+        _touch(tmp_path / "0684801221_sea.pdf")
+        assert read_metadata(str(tmp_path / "0684801221_sea.pdf")).isbn == "0684801221"
+        assert move_isbn_to_end("0684801221_sea.pdf") == "sea.pdf_0684801221"
+        assert move_isbn_to_end("sea.pdf") == "sea.pdf"
+
+    def test_catalog_enrich(self, tmp_path):
+        book_path = tmp_path / "books"
+        _write_epub(book_path / "fiction/sea.epub", "Ernest Hemingway", "9780684801223")
+        _touch(book_path / "fiction/stars.pdf")
+        catalog = BookCatalog(book_path, tmp_path / "catalog.sqlite")
+        catalog.apply(*catalog.scan(full=True))
+        assert catalog.book_index.search("hemingway") == []
+
+        # a batch failing midway, e.g. on a broken process pool, is not lost
+        broken = ThreadPoolExecutor()
+        broken.shutdown()
+        with pytest.raises(RuntimeError):
+            asyncio.run(catalog.enrich(broken))
+        with ThreadPoolExecutor() as executor:
+            assert asyncio.run(catalog.enrich(executor)) == 0
+        assert catalog.book_index.search("hemingway") == [0]
+        assert catalog.book_index.search("sea 9780684801223") == [0]
+        assert catalog.book_df.loc[0, "author"] == "Ernest Hemingway"
+
+        # merged metadata is part of the snapshot, nothing left to enrich after loading it
+        loaded = BookCatalog(book_path, tmp_path / "catalog.sqlite")
+        assert loaded.load_snapshot()
+        assert loaded.book_index.search("hemingway") == [0]
+        with ThreadPoolExecutor() as executor:
+            assert asyncio.run(loaded.enrich(executor)) == 0
+
+    @pytest.mark.asyncio
+    async def test_catalog_enrich_quarantines_poison_files(self, tmp_path):
+        _write_epub(tmp_path / "fiction/sea.epub", "Ernest Hemingway", "9780684801223")
+        _touch(tmp_path / "fiction/crash.pdf")
+        _touch(tmp_path / "fiction/hang.pdf")
+        catalog = BookCatalog(tmp_path)
+        catalog.apply(*catalog.scan(full=True))
+
+        # the pool breaks on one file and another one hangs: the rest is merged all the same
+        with pytest.raises(BrokenProcessPool):
+            await catalog.enrich(_PoisonExecutor(), timeout=0.1)
+        assert catalog.book_index.search("hemingway") != []
+        # neither is tried again by the next pool
+        assert await catalog.enrich(_PoisonExecutor(), timeout=0.1) == 0
+
+        _touch(tmp_path / "science/hang.pdf")
+        catalog.apply(*catalog.scan(full=True))
+        with pytest.raises(TimeoutError):
+            await catalog.enrich(_PoisonExecutor(), timeout=0.1)
+        assert await catalog.enrich(_PoisonExecutor(), timeout=0.1) == 0
+
+    def test_prefix_index(self):
+        names = ["Harry Potter", "Les Misérables", "The Old Man and the Sea", "Harbor"]
+        prefix_index = PrefixIndex(enumerate(names))
+        assert prefix_index.search("harr pot") == [0]
+        assert prefix_index.search("miser") == [1]
+        assert sorted(prefix_index.search("har")) == [0, 3]
+        assert prefix_index.search("the") == [2]
+        assert prefix_index.search("sea old") == [2]
+        assert prefix_index.search("har", limit=1) in ([0], [3])
+        assert prefix_index.search("otter") == []
+
+        prefix_index.remove(0)
+        prefix_index.add_many([(4, "Harry Potter and the Chamber of Secrets")])
+        assert prefix_index.search("harry") == [4]
+        assert prefix_index.search("chamber") == [4]
+
+    @pytest.mark.asyncio
+    async def test_inline_search_sends_cached_document(self, tmp_path):
+        _touch(tmp_path / "fiction/sea.epub")
+        _touch(tmp_path / "fiction/sea wolf.epub")
+        catalog = BookCatalog(tmp_path)
+        catalog.apply(*catalog.scan(full=True))
+        file_id_cache = FileIdCache()
+        uploaded = tmp_path / "fiction/sea.epub"
+        file_id_cache.put(uploaded, uploaded.stat(), "file-id-1")
+
+        answers = []
+
+        async def answer(results, **kwargs):
+            answers.append(results)
+
+        update = SimpleNamespace(
+            effective_user=SimpleNamespace(id=1),
+            inline_query=SimpleNamespace(query="sea", answer=answer),
+        )
+        context = SimpleNamespace(
+            bot_data={
+                "bot_config": SimpleNamespace(
+                    white_list_id=None, catalog=catalog, file_id_cache=file_id_cache
+                )
+            }
+        )
+        await inline_search_handler(update, context)
+        results = {result.title: result for result in answers[0]}
+        assert isinstance(results["sea"], InlineQueryResultCachedDocument)
+        assert results["sea"].document_file_id == "file-id-1"
+        assert isinstance(results["sea wolf"], InlineQueryResultArticle)
+
+    @pytest.mark.asyncio
+    async def test_send_to_boox_reports_failed_upload(self, tmp_path):
+        _touch(tmp_path / "sea.epub")
+        message = _FakeMessage()
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=1), message=message)
+        context = SimpleNamespace(
+            bot_data={
+                "bot_config": SimpleNamespace(
+                    white_list_id=None, boox_url="http://boox/upload"
+                ),
+                "http_client": httpx.AsyncClient(
+                    transport=httpx.MockTransport(
+                        lambda request: httpx.Response(500, text="disk full")
+                    )
+                ),
+            }
+        )
+        # a status message that cannot be deleted does not hide the outcome
+        await send_to_boox_handler(update, context, tmp_path / "sea.epub")
+        assert message.replies[-1] == "Error sending to Boox"
+
+        await close_http_client(context)
+        assert "http_client" not in context.bot_data
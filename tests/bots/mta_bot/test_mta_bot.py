@@ -0,0 +1,197 @@
+from datetime import datetime, time
+
+import pandas as pd
+import pytest
+
+from bot_common.chat_store import ChatStore
+from bots.mta_bot.arrival_index import ArrivalIndex
+from bots.mta_bot.feed_fetcher import FeedFetcher
+from bots.mta_bot.feed_recorder import FeedRecorder, FeedReplay
+from bots.mta_bot.stop_directory import StopDirectory
+from bots.mta_bot.watch import Watch, WatchBoard
+from public_transit.nyc_mta.query.feed_query import RouteGroup
+
+
+class _FakeQuery:
+    """one arrival per route group, raising for the route groups in down"""
+
+    def __init__(self):
+        self.down = set()
+        self.idle = set()
+
+    def __call__(self, stop_parent_id, direction, route_group, api_key):
+        if route_group in self.down:
+            raise ConnectionError(f"{route_group.name} feed down")
+        if route_group in self.idle:
+            return []
+        return [(route_group.name, len(route_group.name))]
+
+
+class TestMTABot:
+    @pytest.mark.asyncio
+    async def test_rebuild_falls_back_to_last_good(self):
+        query = _FakeQuery()
+        feed_fetcher = FeedFetcher("", cache_ttl=0, stale_ttl=600, query=query)
+        index = ArrivalIndex(feed_fetcher)
+        assert index.lookup("A16", "N", max_age=60) is None  # marks the stop hot
+        await index.rebuild()
+        assert len(index.lookup("A16", "N", max_age=60).arrivals) == len(RouteGroup)
+
+        route_group = next(iter(RouteGroup))
+        query.down.add(route_group)
+        await index.rebuild()
+        stop_arrivals = index.lookup("A16", "N", max_age=60)
+        # the failed route group is answered from its last good result, with its age
+        assert len(stop_arrivals.arrivals) == len(RouteGroup)
+        assert stop_arrivals.missing == () and stop_arrivals.stale_age > 0
+        live = await feed_fetcher.query_stop("A16", "N")
+        assert live.missing == () and live.stale_age > 0
+
+        # without any good result it is missing
+        stop_arrivals = await feed_fetcher.query_stop("F20", "S")
+        assert stop_arrivals.missing == (route_group.name,)
+
+    @pytest.mark.asyncio
+    async def test_hot_stops_bounded(self):
+        query = _FakeQuery()
+        feed_fetcher = FeedFetcher("", cache_ttl=0, stale_ttl=0, query=query)
+        index = ArrivalIndex(feed_fetcher, max_hot=2)
+        for stop_parent_id in ["A16", "F20", "A16", "L08"]:
+            index.lookup(stop_parent_id, "N", max_age=60)
+        await index.rebuild()
+        # F20 was asked for least recently, it is dropped
+        assert index.lookup("A16", "N", max_age=60) is not None
+        assert index.lookup("L08", "N", max_age=60) is not None
+        assert index.lookup("F20", "N", max_age=60) is None
+
+    @pytest.mark.asyncio
+    async def test_failed_prefetch_not_served_as_fresh(self):
+        query = _FakeQuery()
+        # no stale results kept: a failed feed has nothing to fall back to
+        feed_fetcher = FeedFetcher("", cache_ttl=0, stale_ttl=0, query=query)
+        index = ArrivalIndex(feed_fetcher)
+        index.lookup("A16", "N", max_age=60)
+        await index.rebuild()
+        assert index.lookup("A16", "N", max_age=60) is not None
+
+        query.down.update(RouteGroup)
+        for _ in range(3):
+            await index.rebuild()
+            assert index.lookup("A16", "N", max_age=60) is None
+        with pytest.raises(ConnectionError):
+            await feed_fetcher.query_stop("A16", "N")
+
+    @pytest.mark.asyncio
+    async def test_resumed_route_group_queried(self):
+        query = _FakeQuery()
+        route_group = next(iter(RouteGroup))
+        query.idle.add(route_group)
+        feed_fetcher = FeedFetcher("", cache_ttl=0, query=query)
+        stop_arrivals = await feed_fetcher.query_stop("A16", "N")
+        assert len(stop_arrivals.arrivals) == len(RouteGroup) - 1
+
+        # a suspended line running again shows up on the next query
+        query.idle.clear()
+        stop_arrivals = await feed_fetcher.query_stop("A16", "N")
+        assert len(stop_arrivals.arrivals) == len(RouteGroup)
+
+    @pytest.mark.asyncio
+    async def test_query_stops_keeps_failed_stop_apart(self):
+        query = _FakeQuery()
+        feed_fetcher = FeedFetcher("", cache_ttl=0, stale_ttl=600, query=query)
+        await feed_fetcher.query_stop("A16", "N")
+        query.down.update(RouteGroup)
+        # A16N falls back to its last good result, F20S has none
+        results = await feed_fetcher.query_stops([("A16", "N"), ("F20", "S")])
+        assert len(results[("A16", "N")].arrivals) == len(RouteGroup)
+        assert isinstance(results[("F20", "S")], ConnectionError)
+
+    def test_feed_record_and_replay(self, tmp_path):
+        query = _FakeQuery()
+        recorder = FeedRecorder(query, tmp_path)
+        route_group = next(iter(RouteGroup))
+        recorder("A16", "N", route_group, "")
+        query.idle.add(route_group)
+        recorder("A16", "N", route_group, "")  # appended, the last answer wins
+        recorder("F20", "S", route_group, "")
+        recorder.close()
+        with open(tmp_path / f"{route_group.name}.records.pkl", "ab") as f:
+            f.write(b"\x80\x04\x95")  # cut off mid write
+
+        replay = FeedReplay(tmp_path)
+        assert replay("A16", "N", route_group, "") == []
+        assert replay("F20", "S", route_group, "") == []
+        assert replay("A99", "N", route_group, "") == []
+        query.idle.clear()
+        recorder = FeedRecorder(query, tmp_path)
+        recorder("L08", "N", route_group, "")
+        recorder.close()
+        assert FeedReplay(tmp_path)("L08", "N", route_group, "") == [
+            (route_group.name, len(route_group.name))
+        ]
+
+    def test_watch_parse_and_window(self):
+        watch = Watch.parse("a16u 8:05 - 8:30")
+        assert watch == Watch("A16", "N", time(8, 5), time(8, 30))
+        assert str(watch) == "A16N 08:05-08:30" and Watch.parse(str(watch)) == watch
+        assert Watch.parse("A16N 8:65-9:00") is None
+        assert Watch.parse("A16X 8:05-8:30") is None
+        assert watch.is_active(time(8, 5)) and watch.is_active(time(8, 30))
+        assert not watch.is_active(time(8, 31))
+
+        # a window across midnight
+        night = Watch.parse("F20S 23:30-0:15")
+        assert night.is_active(time(23, 45)) and night.is_active(time(0, 10))
+        assert not night.is_active(time(12, 0)) and not night.is_active(time(0, 16))
+
+    def test_watch_board(self, tmp_path):
+        store = ChatStore(tmp_path / "state.sqlite", "watches")
+        board = WatchBoard(store)
+        board.add(1, Watch.parse("A16N 8:05-8:30"))
+        board.add(1, Watch.parse("F20S 17:00-18:00"))
+        board.add(1, Watch.parse("A16N 8:05-8:30"))
+        board.add(2, Watch.parse("A16N 7:00-9:00"))
+
+        active, stop_keys = board.active(datetime(2024, 5, 6, 8, 10))
+        assert set(active) == {1, 2} and stop_keys == {("A16", "N")}
+
+        # kept across restarts
+        board = WatchBoard(ChatStore(tmp_path / "state.sqlite", "watches"))
+        assert [str(w) for w in board.chats[1].watches] == [
+            "A16N 08:05-08:30",
+            "F20S 17:00-18:00",
+        ]
+
+        assert board.remove(1, ("A16", "N")) == 1
+        assert board.remove(1, ("A16", "N")) == 0
+        assert board.remove(2) == 1 and 2 not in board.chats
+        assert board.remove(3) == 0
+        board = WatchBoard(ChatStore(tmp_path / "state.sqlite", "watches"))
+        assert set(board.chats) == {1} and len(board.chats[1].watches) == 1
+
+    def test_stop_directory_search(self):
+        stop_info_df = pd.DataFrame(
+            {
+                "stop_id": ["A09", "A11", "631", "A16", "D13"],
+                "stop_name": [
+                    "125 St",
+                    "145 St",
+                    "Grand Central-42 St",
+                    "Grand St",
+                    "34 St-Herald Sq",
+                ],
+            }
+        )
+        stop_info_df["route"] = [x[0] for x in stop_info_df["stop_id"]]
+        stop_directory = StopDirectory(stop_info_df)
+        # substring matches, as before
+        assert stop_directory.search("25") == "125 St = A09"
+        assert stop_directory.search("5 st") == "125 St = A09\n145 St = A11"
+        assert (
+            stop_directory.search("and") == "Grand Central-42 St = 631\nGrand St = A16"
+        )
+        # and every word a prefix of a word of the name, in any order
+        assert stop_directory.search("central grand") == "Grand Central-42 St = 631"
+        assert stop_directory.search("sq herald") == "34 St-Herald Sq = D13"
+        assert stop_directory.search("canal") is None
+        assert stop_directory.stations_for_route("A").splitlines()[0] == "125 St = A09"
@@ -0,0 +1,36 @@
+import random
+
+from bots.mta_bot.stop_grid import StopGrid
+
+
+class TestStopGrid:
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(0)
+        # roughly the extent of the subway, stations clustered like in Manhattan and spread elsewhere
+        stops = [
+            (f"S{i}", 40.57 + rng.random() * 0.33, -74.03 + rng.random() * 0.28)
+            for i in range(300)
+        ] + [
+            (f"M{i}", 40.75 + rng.random() * 0.01, -73.99 + rng.random() * 0.01)
+            for i in range(50)
+        ]
+        grid = StopGrid(stops, cell_m=500)
+        for _ in range(300):
+            lat, lon = 40.55 + rng.random() * 0.37, -74.05 + rng.random() * 0.32
+            k, max_distance_m = rng.choice([1, 3, 5]), rng.choice([300, 1000, 2000])
+            expected = sorted(
+                (grid.distance_m(lat, lon, stop_lat, stop_lon), stop_id)
+                for stop_id, stop_lat, stop_lon in stops
+            )
+            expected = [
+                (stop_id, distance)
+                for distance, stop_id in expected[:k]
+                if distance <= max_distance_m
+            ]
+            assert grid.nearest(lat, lon, k, max_distance_m) == expected
+
+    def test_far_or_empty(self):
+        grid = StopGrid([("A16", 40.7, -74.0)])
+        assert grid.nearest(40.7, -74.0) == [("A16", 0.0)]
+        assert grid.nearest(41.7, -74.0) == []
+        assert StopGrid([]).nearest(40.7, -74.0) == []